@@ -23,8 +23,10 @@ import webbrowser
 from configparser import ConfigParser
 from tkinter import filedialog, messagebox
 
-from PIL import ImageTk
+from PIL import ImageColor, ImageFont, ImageTk
 
+import src.archives as archives
+import src.cache as cache
 import src.process_imgs as process
 import src.widgets as widgets
 from src.values import *
@@ -71,6 +73,15 @@ def bool_from_string(string):
     return False
 
 
+# reads an integer option of the main section, a missing or invalid value (e.g. edited by hand) is replaced by fallback
+def int_from_config(option, fallback):
+    try:
+        return config.getint("main", option, fallback=fallback)
+    except ValueError:
+        print("invalid value of {}, using {}".format(option, fallback))
+        return fallback
+
+
 class GUI:
     def __init__(self):
         self.root = None
@@ -85,6 +96,9 @@ class GUI:
         self.lang = config.get("main", "language")
         self.suffix_default = config.get("main", "suffix")
         self.output_default = config.get("main", "destination")
+        self.durability = config.get("main", "durability", fallback=default_durability)
+        if self.durability not in durability_modes:
+            self.durability = default_durability
 
         # frames
         self.main_frame = None
@@ -93,6 +107,7 @@ class GUI:
         self.param_frame_position = None
         self.param_frame_crop_pre = None
         self.param_frame_crop_var = None
+        self.param_frame_crop_regions = None
         self.param_frame_percentage = None
         self.param_frame_aspect = None
         self.param_frame_enhance = None
@@ -108,16 +123,27 @@ class GUI:
         self.param_crop_mode = None
         self.param_position = None
         self.param_left = None
+        self.param_boxes = None
         self.param_top = None
         self.param_percentage = None
         self.param_aspect = None
         self.param_leq_geq = None
+        self.param_exact = None
         self.param_contrast = None
         self.param_saturation = None
         self.param_brightness = None
         self.param_sharpness = None
         self.param_flip_mode = None
         self.param_rotate = None
+        self.param_resample = None
+        self.param_fillcolor = None
+        self.param_opacity = None
+        self.param_scale = None
+        self.param_pattern = None
+        self.param_text = None
+        self.param_font_size = None
+        self.param_color = None
+        self.param_font = None
         self.param_watermark_mode = None
         self.param_watermark_radiogroup = None
         self.param_watermark_left = None
@@ -125,6 +151,7 @@ class GUI:
 
         # radiobuttons that need to be toggled
         self.radios_leq_geq = None
+        self.checkbox_exact = None
 
         # used when changing the language
         self.labels = {}  # dictionary to hold all labels, the keys are the text-codes needed to get the labels' text
@@ -160,6 +187,23 @@ class GUI:
         # images
         self.img_preview = None
 
+        # persistent cache of downscaled preview sources
+        try:
+            cache_size = int_from_config("thumbnail_cache_size", thumbnail_cache_size)
+            self.thumbnail_cache = cache.ThumbnailCache(max_bytes=cache_size * 1024 * 1024)
+        except OSError as e:  # previews are decoded from the sources without cache
+            print("error creating thumbnail cache:", e)
+            self.thumbnail_cache = None
+
+        # optional persistent cache of processed images
+        self.result_cache = None
+        cache_size = int_from_config("result_cache_size", result_cache_size)
+        if cache_size > 0:
+            try:
+                self.result_cache = cache.ResultCache(max_bytes=cache_size * 1024 * 1024)
+            except OSError as e:  # images are always processed
+                print("error creating result cache:", e)
+
         self.run()
 
     # opens a filedialog and fills in the selected source directory
@@ -176,7 +220,10 @@ class GUI:
     # opens a filedialog and fills in the selected source files
     def input_select_files(self):
         files = filedialog.askopenfilenames(title=get_ui_text("filedialog_files", self.lang),
-                                            filetypes=((get_ui_text("filedialog_types", self.lang), "*.png;*.jpg"),))
+                                            filetypes=((get_ui_text("filedialog_types", self.lang),
+                                                        ";".join("*." + ext for ext in supported_extensions)),
+                                                       (get_ui_text("filedialog_archives", self.lang),
+                                                        ";".join("*." + ext for ext in archive_extensions))))
         if files == "":
             return
         self.input_text_field.delete(0, tk.END)
@@ -193,7 +240,8 @@ class GUI:
     # opens a filedialog and fills in the selected watermark file
     def watermark_select_file(self):
         file = filedialog.askopenfilename(title=get_ui_text("filedialog_file", self.lang),
-                                          filetypes=((get_ui_text("filedialog_types", self.lang), "*.png;*.jpg"),))
+                                          filetypes=((get_ui_text("filedialog_types", self.lang),
+                                                      ";".join("*." + ext for ext in supported_extensions)),))
         if file != "":
             self.watermark_text_field.delete(0, tk.END)
             self.watermark_text_field.insert(0, file)
@@ -245,6 +293,7 @@ class GUI:
             self.param_frame_flip.grid_forget()
             self.param_frame_rotate.grid_forget()
             self.param_frame_watermark.grid_forget()
+            self.command_crop_mode()
         elif value == get_ui_text("tool_options", self.lang)[1]:  # resize by percentage
             self.param_frame_width_height.grid_forget()
             self.param_frame_position.grid_forget()
@@ -313,9 +362,19 @@ class GUI:
     def command_aspect_check(self):
         self.radios_leq_geq[0].configure(state=("normal" if self.param_aspect.get() else "disabled"))
         self.radios_leq_geq[1].configure(state=("normal" if self.param_aspect.get() else "disabled"))
+        self.checkbox_exact.configure(state=("normal" if self.param_aspect.get() else "disabled"))
 
     # toggle the two different frames for the crop position
     def command_crop_mode(self):
+        if self.param_crop_mode.get() == 2:  # several regions, which have their own sizes
+            self.param_frame_width_height.grid_forget()
+            self.param_frame_crop_pre.grid_forget()
+            self.param_frame_crop_var.grid_forget()
+            self.param_frame_crop_regions.grid(row=1, column=0, columnspan=3)
+            return
+
+        self.param_frame_width_height.grid(row=0, column=0)
+        self.param_frame_crop_regions.grid_forget()
         if self.param_crop_mode.get():
             self.param_frame_crop_pre.grid_forget()
             self.param_frame_crop_var.grid(row=1, column=0, columnspan=2)
@@ -427,6 +486,11 @@ class GUI:
             correct = False
             errors.append(get_ui_text("error_output", self.lang))
 
+        # every source file is processed on its own, so each would replace the archive of the one before
+        if ", " in self.input_text_field.get() and archives.is_archive_output(self.output_text_field.get()):
+            correct = False
+            errors.append(get_ui_text("error_archive_output", self.lang))
+
         # make sure the filenames contain no commas
         if "," in self.input_text_field.get():
             for path in self.input_text_field.get().split(", "):
@@ -489,6 +553,56 @@ class GUI:
             correct = False
             errors.append(get_ui_text("error_params_num", self.lang))
 
+        if self.param_boxes.winfo_ismapped():
+            try:  # check the regions of the multi region crop
+                if any(len(box) != 4 or min(box[2:]) <= 0 for box in process.parse_boxes(self.param_boxes.get())):
+                    raise ValueError
+            except ValueError:
+                correct = False
+                errors.append(get_ui_text("error_boxes", self.lang))
+
+        if self.param_fillcolor.winfo_ismapped() and self.param_fillcolor.get() != "":
+            try:  # check the fill color
+                ImageColor.getrgb(self.param_fillcolor.get())
+            except ValueError:
+                correct = False
+                errors.append(get_ui_text("error_fillcolor", self.lang))
+
+        if self.param_opacity.winfo_ismapped() and self.param_opacity.get() != "":
+            try:  # check the opacity
+                if not 0 <= float(self.param_opacity.get()) <= 1:
+                    raise ValueError
+            except ValueError:
+                correct = False
+                errors.append(get_ui_text("error_opacity", self.lang))
+
+        if self.param_scale.winfo_ismapped() and self.param_scale.get() != "":
+            try:  # check the relative width of the watermark
+                if not 0 < float(self.param_scale.get()) <= 1:
+                    raise ValueError
+            except ValueError:
+                correct = False
+                errors.append(get_ui_text("error_scale", self.lang))
+
+        if self.param_text.winfo_ismapped() and self.param_text.get() != "":
+            try:  # check the font size of the text watermark
+                if not int(self.param_font_size.get()) > 0:
+                    raise ValueError
+            except ValueError:
+                correct = False
+                errors.append(get_ui_text("error_font_size", self.lang))
+            try:  # check the color of the text watermark
+                ImageColor.getrgb(self.param_color.get())
+            except ValueError:
+                correct = False
+                errors.append(get_ui_text("error_color", self.lang))
+            if self.param_font.get() != "":
+                try:  # check the font of the text watermark, a file or the name of an installed font
+                    ImageFont.truetype(self.param_font.get(), 10)
+                except OSError:
+                    correct = False
+                    errors.append(get_ui_text("error_font", self.lang))
+
         try:  # check the suffix
             suffix = self.suffix_text_field.get()
             for char in "<>:\"/\\|?*":
@@ -500,8 +614,8 @@ class GUI:
             correct = False
             errors.append(get_ui_text("error_suffix", self.lang))
 
-        if self.watermark_text_field.winfo_ismapped():
-            try:  # check watermark image path
+        if self.watermark_text_field.winfo_ismapped() and self.param_text.get() == "":
+            try:  # check watermark image path, unless a text is used instead
                 if not os.path.isfile(self.watermark_text_field.get()):
                     correct = False
                     errors.append(get_ui_text("error_watermark_file", self.lang))
@@ -539,14 +653,11 @@ class GUI:
         if correct:
             params = self.collect_tool_params()
 
-            if ", " in self.input_text_field.get():
-                paths = self.input_text_field.get().split(", ")
-                self.img_preview = ImageTk.PhotoImage(process.preview_img(paths[0], params, tool, self.lang,
-                                                                          self.window_preview, new_window))
-            else:
-                self.img_preview = ImageTk.PhotoImage(
-                    process.preview_img(self.input_text_field.get(), params, tool, self.lang, self.window_preview,
-                                        new_window))
+            path = self.input_text_field.get().split(", ")[0]
+            preview = process.preview_img(path, params, tool, self.lang, self.window_preview, new_window,
+                                          self.thumbnail_cache)
+            if preview is not None:  # not generated, e.g. for an unreadable image or an archive without images
+                self.img_preview = ImageTk.PhotoImage(preview)
 
         # actually place the preview on the window
         if self.window_preview_canvas is not None:
@@ -585,10 +696,12 @@ class GUI:
                 paths = self.input_text_field.get().split(", ")
                 for path in paths:
                     count += process.process_imgs(path, params, tool, self.output_text_field.get(), self.lang,
-                                                  self.suffix_text_field.get())
+                                                  self.suffix_text_field.get(), durability=self.durability,
+                                                  result_cache=self.result_cache)
             else:
                 count += process.process_imgs(self.input_text_field.get(), params, tool, self.output_text_field.get(),
-                                              self.lang, self.suffix_text_field.get())
+                                              self.lang, self.suffix_text_field.get(), durability=self.durability,
+                                              result_cache=self.result_cache)
             if self.menu_popups_var_info.get():
                 show_info([get_ui_text("info_result", self.lang) + str(count)])
         else:
@@ -599,7 +712,9 @@ class GUI:
         tool = self.select_tool_sv.get()
         params = None
         if tool == get_ui_text("tool_options", self.lang)[0]:  # crop image
-            if self.param_crop_mode.get():
+            if self.param_crop_mode.get() == 2:  # several regions
+                params = process.Params(boxes=self.param_boxes.get())
+            elif self.param_crop_mode.get():
                 params = process.Params(width=self.param_width.get(), height=self.param_height.get(),
                                         left=self.param_left.get(), top=self.param_top.get())
             else:
@@ -609,8 +724,9 @@ class GUI:
             percentage = int(self.param_percentage.get().replace("%", ""))
             params = process.Params(perc=percentage)
         elif tool == get_ui_text("tool_options", self.lang)[2]:  # resize by dimensions
+            pos = 4 if self.param_aspect.get() and self.param_exact.get() else None  # centered
             params = process.Params(width=self.param_width.get(), height=self.param_height.get(),
-                                    keep_aspect=self.param_aspect.get(), leq_geq=self.param_leq_geq.get())
+                                    keep_aspect=self.param_aspect.get(), leq_geq=self.param_leq_geq.get(), pos=pos)
         elif tool == get_ui_text("tool_options", self.lang)[3]:  # enhance images
             contrast, saturation = float(self.param_contrast.get()), float(self.param_saturation.get())
             brightness, sharpness = float(self.param_brightness.get()), float(self.param_sharpness.get())
@@ -621,14 +737,26 @@ class GUI:
         elif tool == get_ui_text("tool_options", self.lang)[5]:  # flip images
             params = process.Params(flip_mode=self.param_flip_mode.get())
         elif tool == get_ui_text("tool_options", self.lang)[6]:  # rotate images
-            params = process.Params(angle=float(self.param_rotate.get()))
+            fillcolor = self.param_fillcolor.get() if self.param_fillcolor.get() != "" else None
+            params = process.Params(angle=float(self.param_rotate.get()), resample=self.param_resample.get(),
+                                    fillcolor=fillcolor)
         elif tool == get_ui_text("tool_options", self.lang)[7]:  # create watermark
+            opacity = self.param_opacity.get() if self.param_opacity.get() != "" else None
+            scale = self.param_scale.get() if self.param_scale.get() != "" else None
+            pattern = True if self.param_pattern.get() else None  # the position is ignored for patterns
+            if self.param_text.get() != "":  # text instead of the image
+                text = dict(text=self.param_text.get(), font_size=self.param_font_size.get(),
+                            color=self.param_color.get())
+                if self.param_font.get() != "":  # otherwise the default font
+                    text["font"] = self.param_font.get()
+            else:
+                text = dict(img_path=self.watermark_text_field.get())
             if self.param_watermark_mode.get():  # variable position
-                params = process.Params(img_path=self.watermark_text_field.get(), left=self.param_watermark_left.get(),
-                                        top=self.param_watermark_top.get())
+                params = process.Params(left=self.param_watermark_left.get(), top=self.param_watermark_top.get(),
+                                        opacity=opacity, scale=scale, pattern=pattern, **text)
             else:  # predefined position
-                params = process.Params(img_path=self.watermark_text_field.get(),
-                                        pos=self.param_watermark_radiogroup.get_value())
+                params = process.Params(pos=self.param_watermark_radiogroup.get_value(), opacity=opacity, scale=scale,
+                                        pattern=pattern, **text)
 
         return params
 
@@ -842,6 +970,13 @@ class GUI:
         param_radio_crop_1.grid(row=0, column=1)
         self.buttons["radio_position_var_0"] = param_radio_crop_1
 
+        param_radio_crop_2 = tk.Radiobutton(param_frame_position,
+                                            text=get_ui_text("radio_regions", self.lang),
+                                            padx=10, variable=param_var_crop, value=2, bg=color_bg,
+                                            command=self.command_crop_mode)
+        param_radio_crop_2.grid(row=0, column=2)
+        self.buttons["radio_regions_0"] = param_radio_crop_2
+
         # param frame for predefined position
         param_frame_crop_pre = tk.Frame(self.param_frame_position, bg=color_bg)
         param_frame_crop_pre.grid(row=1, column=0, columnspan=2)
@@ -870,6 +1005,18 @@ class GUI:
 
         param_frame_crop_var.grid_forget()
 
+        # param frame for several regions, which are all cut out of every image
+        param_frame_crop_regions = tk.Frame(self.param_frame_position, bg=color_bg)
+        self.param_frame_crop_regions = param_frame_crop_regions
+
+        param_label_boxes = tk.Label(param_frame_crop_regions, text=get_ui_text("label_boxes", self.lang),
+                                     bg=color_bg)
+        param_label_boxes.grid(row=0, column=0, padx=2, pady=5)
+        self.labels["label_boxes_0"] = param_label_boxes
+        param_text_boxes = tk.Entry(param_frame_crop_regions, width=50, relief=tk.FLAT)
+        param_text_boxes.grid(row=1, column=0, padx=5)
+        self.param_boxes = param_text_boxes
+
     def setup_param_frame_resize(self):
         # param frame with percentage (resize by percentage)
         param_frame_percentage = tk.Frame(self.param_frame, bg=color_bg)
@@ -924,6 +1071,18 @@ class GUI:
         param_label_leq_geq_1.grid(row=1, column=3, padx=5)
         self.labels["label_leq_geq_0_1"] = param_label_leq_geq_1
 
+        # crop (>=) or pad (<=) the result to exactly the given dimensions, in a single resampling
+        param_label_exact = tk.Label(param_frame_aspect, text=get_ui_text("label_exact", self.lang), bg=color_bg)
+        param_label_exact.grid(row=2, column=0, columnspan=3, padx=5)
+        self.labels["label_exact_0"] = param_label_exact
+
+        param_var_exact = tk.BooleanVar()
+        param_var_exact.set(False)
+        self.param_exact = param_var_exact
+        param_checkbox_exact = tk.Checkbutton(param_frame_aspect, text="", var=param_var_exact, bg=color_bg)
+        param_checkbox_exact.grid(row=2, column=3)
+        self.checkbox_exact = param_checkbox_exact
+
         param_frame_aspect.grid_forget()
 
     def setup_param_frame_enhance(self):
@@ -1015,6 +1174,31 @@ class GUI:
         param_text_rotate.grid(row=0, column=1, padx=5)
         self.param_rotate = param_text_rotate
 
+        # resampling filter for angles that aren't multiples of 90 degrees
+        param_label_resample = tk.Label(param_frame_rotate, text=get_ui_text("label_resample", self.lang),
+                                        bg=color_bg)
+        param_label_resample.grid(row=1, column=0, padx=2, pady=5)
+        self.labels["label_resample_0"] = param_label_resample
+
+        param_var_resample = tk.IntVar()
+        param_var_resample.set(0)
+        self.param_resample = param_var_resample
+
+        for i, key in enumerate(["radio_nearest", "radio_bilinear", "radio_bicubic"]):
+            param_radio_resample = tk.Radiobutton(param_frame_rotate, text=get_ui_text(key, self.lang), padx=10,
+                                                  variable=param_var_resample, value=i, bg=color_bg)
+            param_radio_resample.grid(row=1, column=i + 1)
+            self.buttons[key + "_0"] = param_radio_resample
+
+        # color for the corners outside of the rotated image
+        param_label_fillcolor = tk.Label(param_frame_rotate, text=get_ui_text("label_fillcolor", self.lang),
+                                         bg=color_bg)
+        param_label_fillcolor.grid(row=2, column=0, padx=2, pady=5)
+        self.labels["label_fillcolor_0"] = param_label_fillcolor
+        param_text_fillcolor = tk.Entry(param_frame_rotate, width=10, relief=tk.FLAT)
+        param_text_fillcolor.grid(row=2, column=1, padx=5)
+        self.param_fillcolor = param_text_fillcolor
+
         param_frame_rotate.grid_forget()
 
     def setup_param_frame_watermark(self):
@@ -1088,6 +1272,74 @@ class GUI:
         param_text_watermark_top.grid(row=0, column=3, padx=5)
         self.param_watermark_top = param_text_watermark_top
 
+        # opacity of the watermark
+        param_frame_watermark_opacity = tk.Frame(param_frame_watermark, bg=color_bg)
+        param_frame_watermark_opacity.grid(row=4, column=0)
+
+        param_label_opacity = tk.Label(param_frame_watermark_opacity, text=get_ui_text("label_opacity", self.lang),
+                                       bg=color_bg)
+        param_label_opacity.grid(row=0, column=0, padx=2, pady=5)
+        self.labels["label_opacity_0"] = param_label_opacity
+        param_text_opacity = tk.Entry(param_frame_watermark_opacity, width=10, relief=tk.FLAT)
+        param_text_opacity.grid(row=0, column=1, padx=5)
+        self.param_opacity = param_text_opacity
+
+        # width of the watermark relative to the image
+        param_label_scale = tk.Label(param_frame_watermark_opacity, text=get_ui_text("label_scale", self.lang),
+                                     bg=color_bg)
+        param_label_scale.grid(row=1, column=0, padx=2, pady=5)
+        self.labels["label_scale_0"] = param_label_scale
+        param_text_scale = tk.Entry(param_frame_watermark_opacity, width=10, relief=tk.FLAT)
+        param_text_scale.grid(row=1, column=1, padx=5)
+        self.param_scale = param_text_scale
+
+        # repeat the watermark over the whole image instead of placing it once
+        param_label_pattern = tk.Label(param_frame_watermark_opacity, text=get_ui_text("label_pattern", self.lang),
+                                       bg=color_bg)
+        param_label_pattern.grid(row=2, column=0, padx=2, pady=5)
+        self.labels["label_pattern_0"] = param_label_pattern
+        param_var_pattern = tk.BooleanVar()
+        param_var_pattern.set(False)
+        self.param_pattern = param_var_pattern
+        param_checkbox_pattern = tk.Checkbutton(param_frame_watermark_opacity, text="", var=param_var_pattern,
+                                                bg=color_bg)
+        param_checkbox_pattern.grid(row=2, column=1)
+
+        # text rendered as watermark instead of the image, {name} is replaced with the name of each image
+        param_label_text = tk.Label(param_frame_watermark_opacity, text=get_ui_text("label_text", self.lang),
+                                    bg=color_bg)
+        param_label_text.grid(row=3, column=0, padx=2, pady=5)
+        self.labels["label_text_0"] = param_label_text
+        param_text_text = tk.Entry(param_frame_watermark_opacity, width=30, relief=tk.FLAT)
+        param_text_text.grid(row=3, column=1, padx=5)
+        self.param_text = param_text_text
+
+        param_label_font_size = tk.Label(param_frame_watermark_opacity, text=get_ui_text("label_font_size", self.lang),
+                                         bg=color_bg)
+        param_label_font_size.grid(row=4, column=0, padx=2, pady=5)
+        self.labels["label_font_size_0"] = param_label_font_size
+        param_text_font_size = tk.Entry(param_frame_watermark_opacity, width=10, relief=tk.FLAT)
+        param_text_font_size.insert(0, str(watermark_font_size))
+        param_text_font_size.grid(row=4, column=1, padx=5)
+        self.param_font_size = param_text_font_size
+
+        param_label_color = tk.Label(param_frame_watermark_opacity, text=get_ui_text("label_color", self.lang),
+                                     bg=color_bg)
+        param_label_color.grid(row=5, column=0, padx=2, pady=5)
+        self.labels["label_color_0"] = param_label_color
+        param_text_color = tk.Entry(param_frame_watermark_opacity, width=10, relief=tk.FLAT)
+        param_text_color.insert(0, watermark_color)
+        param_text_color.grid(row=5, column=1, padx=5)
+        self.param_color = param_text_color
+
+        param_label_font = tk.Label(param_frame_watermark_opacity, text=get_ui_text("label_font", self.lang),
+                                    bg=color_bg)
+        param_label_font.grid(row=6, column=0, padx=2, pady=5)
+        self.labels["label_font_0"] = param_label_font
+        param_text_font = tk.Entry(param_frame_watermark_opacity, width=30, relief=tk.FLAT)
+        param_text_font.grid(row=6, column=1, padx=5)
+        self.param_font = param_text_font
+
         param_frame_watermark.grid_forget()
 
     def setup_input_output(self):
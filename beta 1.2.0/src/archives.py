@@ -0,0 +1,299 @@
+"""
+Copyright © 2021 Jonas Wombacher
+
+This file is part of Image Tools.
+
+Image Tools is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Image Tools is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Image Tools.  If not, see <https://www.gnu.org/licenses/>.
+"""
+import io
+import os
+import queue
+import shutil
+import tarfile
+import tempfile
+import threading
+import time
+import zipfile
+
+import src.stages as stages
+from src.values import *
+
+
+# returns whether name is a relative path inside an archive that stays inside the destination folder, absolute names
+# and names with ".." are skipped, so that no output is written outside of it
+def is_safe_name(name):
+    parts = name.replace("\\", "/").split("/")
+    return not name.startswith(("/", "\\")) and ".." not in parts and ":" not in parts[0]
+
+
+# the members of a zip archive, read like the files of a folder, several threads can read different members at once
+class ZipArchive:
+    seekable = True
+
+    def __init__(self, path):
+        self.zip = zipfile.ZipFile(path)
+        self.infos = {info.filename: info for info in self.zip.infolist()
+                      if not info.is_dir() and is_safe_name(info.filename)}
+
+    def get_filenames(self):
+        return list(self.infos)
+
+    def get_size(self, name):
+        return self.infos[name].file_size
+
+    # returns a seekable file object with the content of the member
+    def open(self, name):
+        return self.zip.open(self.infos[name])
+
+    def read(self, name):
+        with self.open(name) as f:
+            return f.read()
+
+    def close(self):
+        self.zip.close()
+
+
+# a file object for a member of an uncompressed tar, which reads it with its own file handle, so that several threads
+# can read different members at once
+class MemberFile(io.RawIOBase):
+    def __init__(self, path, offset, size):
+        self.file = open(path, "rb")
+        self.offset = offset
+        self.size = size
+        self.position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, buffer):
+        self.file.seek(self.offset + self.position)
+        data = self.file.read(max(0, min(len(buffer), self.size - self.position)))
+        buffer[:len(data)] = data
+        self.position += len(data)
+        return len(data)
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        start = {io.SEEK_SET: 0, io.SEEK_CUR: self.position, io.SEEK_END: self.size}[whence]
+        self.position = max(0, start + offset)
+        return self.position
+
+    def tell(self):
+        return self.position
+
+    def close(self):
+        self.file.close()
+        super().close()
+
+
+# the members of an uncompressed tar archive, read like the files of a folder, the headers are read once, the members
+# are read directly at their offsets
+class TarArchive:
+    seekable = True
+
+    def __init__(self, path):
+        self.path = path
+        with tarfile.open(path, "r:") as tar:  # fails for compressed archives
+            self.members = {member.name: member for member in tar.getmembers()
+                            if member.isfile() and not member.issparse() and is_safe_name(member.name)}
+
+    def get_filenames(self):
+        return list(self.members)
+
+    def get_size(self, name):
+        return self.members[name].size
+
+    def open(self, name):
+        member = self.members[name]
+        return io.BufferedReader(MemberFile(self.path, member.offset_data, member.size))
+
+    def read(self, name):
+        with self.open(name) as f:
+            return f.read()
+
+    def close(self):
+        pass
+
+
+# the members of a compressed tar archive, which can only be read in their order without decompressing the archive
+# again for every member, so they are streamed (see StreamReader)
+class TarStream:
+    seekable = False
+
+    def __init__(self, path):
+        self.path = path
+
+    # yields the name and content of every regular member in the order of the archive
+    def stream(self):
+        with tarfile.open(self.path, "r|*") as tar:
+            for member in tar:
+                if member.isfile() and is_safe_name(member.name):
+                    yield member.name, tar.extractfile(member).read()
+
+    def close(self):
+        pass
+
+
+# returns the archive at path as ZipArchive, TarArchive or TarStream, or None if path is no archive, image files are
+# never taken for archives, even if they contain one
+def open_archive(path):
+    extension = path.rsplit(".", 1)[1] if "." in os.path.basename(path) else ""
+    if extension.lower() in supported_extensions or not os.path.isfile(path):
+        return None
+    if zipfile.is_zipfile(path):
+        return ZipArchive(path)
+    if tarfile.is_tarfile(path):
+        try:
+            return TarArchive(path)
+        except tarfile.ReadError:
+            return TarStream(path)
+    return None
+
+
+# reads the members of a TarStream ahead of their processing in a background thread, get_job is called with the name and
+# content of every member and returns its job, or None to skip the member, get returns the jobs with the content like
+# stages.Prefetcher
+class StreamReader(stages.Prefetcher):
+    def __init__(self, archive, get_job, depth=prefetch_depth):
+        self.get_job = get_job
+        super().__init__(archive, depth)
+
+    def run(self, archive, depth):
+        try:
+            for name, data in archive.stream():
+                job = self.get_job(name, data)
+                if job is not None:
+                    self.queue.put((job, data))
+        except Exception as e:  # truncated or corrupt archive
+            print("error reading archive:", e)
+        finally:
+            self.queue.put(None)
+
+
+# returns whether the outputs for out_dir are written into a single archive: out_dir is a binary file object (e.g.
+# sys.stdout.buffer), which gets a tar stream, or a path with one of the archive_extensions
+def is_archive_output(out_dir):
+    if not isinstance(out_dir, str):
+        return True
+    return out_dir.lower().endswith(tuple("." + ext for ext in archive_extensions)) and not os.path.isdir(out_dir)
+
+
+# returns the compression of a tar archive with the given file name ("" for none)
+def get_tar_compression(path):
+    for extension, compression in (("gz", "gz"), ("tgz", "gz"), ("bz2", "bz2"), ("xz", "xz")):
+        if path.lower().endswith("." + extension):
+            return compression
+    return ""
+
+
+# writes the encoded outputs into a single archive instead of separate files, in a background thread like
+# stages.WriteBehind, so the workers only hand over their outputs and a single thread appends them one after the
+# other, target is the path of a zip or (optionally compressed) tar archive or a binary file object, to which an
+# uncompressed tar stream is written (e.g. for shell pipelines), the outputs are named by their path relative to
+# directory, a temporary folder the workers also write their temporary files to (see stages.get_temp_path),
+# an archive at a path is written to a temporary file first, which replaces target once it is complete, so nobody
+# ever sees a partial archive, with a durability other than "none" it is synced to disk before
+class ArchiveWriter:
+    def __init__(self, target, depth=write_behind_depth, durability=default_durability):
+        self.target = target
+        self.durability = durability
+        self.failed = 0  # number of outputs that couldn't be written
+        self.temp_path = None
+        if isinstance(target, str):
+            self.temp_path = stages.get_temp_path(target)
+            self.directory = tempfile.mkdtemp(prefix=".", dir=os.path.dirname(target) or ".")  # next to the archive
+            if target.lower().endswith(".zip"):  # the images are compressed already, so they are only stored
+                self.archive = zipfile.ZipFile(self.temp_path, "w", zipfile.ZIP_STORED)
+            else:
+                self.archive = tarfile.open(self.temp_path, "w:" + get_tar_compression(target))
+        else:
+            self.directory = tempfile.mkdtemp()
+            self.archive = tarfile.open(fileobj=target, mode="w|")
+        self.queue = queue.Queue(depth)
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            if item == "flush":
+                if not isinstance(self.target, str):
+                    self.target.flush()
+                continue
+
+            path, data, temp_path = item
+            try:
+                self.append(path, data, temp_path)
+            except (OSError, ValueError) as e:
+                print("error writing image:", e)
+                self.failed += 1
+            finally:
+                if temp_path is not None and os.path.exists(temp_path):
+                    os.remove(temp_path)
+
+    # appends an output with the given content or the content of the file at temp_path to the archive
+    def append(self, path, data, temp_path):
+        name = os.path.relpath(path, self.directory).replace(os.sep, "/")
+        if isinstance(self.archive, zipfile.ZipFile):
+            if data is not None:
+                info = zipfile.ZipInfo(name, time.localtime()[:6])
+                info.external_attr = 0o644 << 16
+                self.archive.writestr(info, data)
+            else:
+                self.archive.write(temp_path, name)
+        elif data is not None:
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            info.mtime = int(time.time())
+            info.mode = 0o644
+            self.archive.addfile(info, io.BytesIO(data))
+        else:
+            self.archive.add(temp_path, name)
+
+    # writes the given content to path, i.e. appends it to the archive
+    def write(self, path, data):
+        self.queue.put((path, data, None))
+
+    # appends the complete file a worker wrote to temp_path to the archive under the name of path and deletes it
+    def write_file(self, temp_path, path):
+        self.queue.put((path, None, temp_path))
+
+    # passes the outputs written so far on to the reader of a tar stream, an archive at a path is only complete once it
+    # is closed
+    def flush(self):
+        self.queue.put("flush")
+
+    # waits until all outputs are appended and completes the archive
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+        try:
+            self.archive.close()
+            if self.temp_path is not None:
+                if self.durability != "none":
+                    with open(self.temp_path, "rb+") as f:
+                        os.fsync(f.fileno())
+                os.replace(self.temp_path, self.target)
+                if self.durability != "none":
+                    stages.sync_dir(os.path.dirname(self.target))
+            else:
+                self.target.flush()
+        finally:
+            if self.temp_path is not None and os.path.exists(self.temp_path):
+                os.remove(self.temp_path)
+            shutil.rmtree(self.directory, ignore_errors=True)
@@ -0,0 +1,237 @@
+"""
+Copyright © 2021 Jonas Wombacher
+
+This file is part of Image Tools.
+
+Image Tools is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Image Tools is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Image Tools.  If not, see <https://www.gnu.org/licenses/>.
+"""
+import hashlib
+import os
+import sys
+import threading
+
+from PIL import Image, PngImagePlugin
+
+import src.stages as stages
+from src.values import *
+
+
+# returns the directory for the cache with the given name, following the platform's convention for user caches
+def get_cache_dir(name):
+    if sys.platform == "win32":
+        base = os.environ.get("LOCALAPPDATA", os.path.expanduser("~"))
+    elif sys.platform == "darwin":
+        base = os.path.expanduser("~/Library/Caches")
+    else:
+        base = os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache"))
+    return os.path.join(base, "Image Tools", name)
+
+
+# deletes the least recently used files in the given directory until their total size is at most max_bytes,
+# the modification time of a cache file is refreshed on every hit, so it serves as the time of last use, temporary
+# files (see stages.get_temp_path) are still being written by other threads or instances and are left alone
+def evict_lru(directory, max_bytes):
+    entries = []
+    total = 0
+    for entry in os.scandir(directory):
+        if entry.is_file() and not stages.is_temp_name(entry.name):
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total += stat.st_size
+
+    entries.sort()
+    for _, size, path in entries:
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+            total -= size
+        except OSError:  # removed by another instance in the meantime
+            pass
+
+    return total
+
+
+# decodes the image at path downscaled so that its longer side is at most resolution, JPEGs are already scaled down
+# while decoding
+def create_thumbnail(path, resolution):
+    with Image.open(path) as img:
+        source_size = img.size
+        img.thumbnail((resolution, resolution))
+        if img.mode not in ("1", "L", "LA", "P", "RGB", "RGBA"):  # modes that can't be stored as png
+            thumb = img.convert("RGBA" if "A" in img.mode else "RGB")
+        else:
+            thumb = img.copy()
+
+    thumb.info["source_size"] = "{},{}".format(*source_size)
+    return thumb
+
+
+# persistent cache of downscaled decodes, used as preview sources, entries are keyed by path, size and modification
+# time of the source and the target resolution and are evicted least recently used first once max_bytes is exceeded
+class ThumbnailCache:
+    def __init__(self, directory=None, max_bytes=thumbnail_cache_size * 1024 * 1024):
+        self.directory = directory if directory is not None else get_cache_dir("thumbnails")
+        self.max_bytes = max_bytes
+        os.makedirs(self.directory, exist_ok=True)
+
+    # returns the path of the cache file for the source at path and the given resolution
+    def get_cache_path(self, path, resolution):
+        stat = os.stat(path)
+        key = "{}|{}|{}|{}".format(os.path.abspath(path), stat.st_size, stat.st_mtime_ns, resolution)
+        return os.path.join(self.directory, hashlib.sha1(key.encode("utf-8")).hexdigest() + ".png")
+
+    # returns a thumbnail of the image at path with a longer side of at least resolution (unless the source is
+    # smaller) and the factor it was scaled by, the thumbnail is decoded from the source only on a cache miss
+    def get(self, path, resolution):
+        resolution = -(-resolution // thumbnail_cache_step) * thumbnail_cache_step
+        cache_path = self.get_cache_path(path, resolution)
+
+        try:
+            with Image.open(cache_path) as thumb:
+                thumb.load()
+            os.utime(cache_path)  # mark as recently used
+        except (OSError, SyntaxError, ValueError):  # cache miss or damaged entry
+            thumb = create_thumbnail(path, resolution)
+            self.put(cache_path, thumb)
+
+        source_width = int(thumb.info["source_size"].split(",")[0])
+        return thumb, thumb.width / source_width
+
+    # stores the thumbnail under cache_path and evicts old entries if the size cap is exceeded
+    def put(self, cache_path, thumb):
+        info = PngImagePlugin.PngInfo()
+        info.add_text("source_size", thumb.info["source_size"])
+        temp_path = "{}.{}.tmp".format(cache_path, os.getpid())
+        try:
+            thumb.save(temp_path, "PNG", pnginfo=info, compress_level=1)
+            os.replace(temp_path, cache_path)  # other instances never see half written entries
+        except OSError as e:
+            print("error caching thumbnail:", e)
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            return
+
+        evict_lru(self.directory, self.max_bytes)
+
+
+# returns the sha256 of the given bytes or of the content of the file at the given path
+def get_content_hash(source):
+    if isinstance(source, bytes):
+        return hashlib.sha256(source).hexdigest()
+
+    sha = hashlib.sha256()
+    with open(source, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+# persistent content addressed cache of encoded outputs, entries are keyed by the content of the source, the tool, its
+# params and the output format, so identical sources are only processed once, no matter where they are stored or
+# which folder they are written to, entries are evicted least recently used first once max_bytes is exceeded
+class ResultCache:
+    def __init__(self, directory=None, max_bytes=result_cache_size * 1024 * 1024,
+                 hardlink=result_cache_hardlink):
+        self.directory = directory if directory is not None else get_cache_dir("results")
+        self.max_bytes = max_bytes
+        self.hardlink = hardlink  # hits are hardlinked instead of reflinked or copied
+        os.makedirs(self.directory, exist_ok=True)
+        self.lock = threading.Lock()
+        self.size = evict_lru(self.directory, self.max_bytes)  # total size of all entries
+
+    # returns the key of the output of the given tool (see get_tool_method) for source (its content or its path)
+    @staticmethod
+    def get_key(source, tool, params, extension):
+        fingerprint = [result_cache_version, tool.__name__, extension.lower(), sorted(vars(params).items())]
+        if hasattr(params, "img_path"):  # the watermark may change under the same path
+            stat = os.stat(params.img_path)
+            fingerprint.append((stat.st_size, stat.st_mtime_ns))
+
+        key = get_content_hash(source) + repr(fingerprint)
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+    def get_cache_path(self, key):
+        return os.path.join(self.directory, key)
+
+    # creates the file at path with the cached output for key, returns False on a cache miss
+    def get(self, key, path):
+        cache_path = self.get_cache_path(key)
+        try:
+            stages.clone_file(cache_path, path, self.hardlink)
+        except OSError:
+            if os.path.exists(path):
+                os.remove(path)
+            return False
+
+        try:
+            os.utime(cache_path)  # mark as recently used
+        except OSError:  # evicted in the meantime
+            pass
+        return True
+
+    # stores data as the output for key
+    def put(self, key, data):
+        temp_path = stages.get_temp_path(self.get_cache_path(key))
+        try:
+            with open(temp_path, "wb") as f:
+                f.write(data)
+        except OSError as e:
+            print("error caching result:", e)
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            return
+        self.add(temp_path, key)
+
+    # stores the complete file at path as the output for key, path stays unchanged
+    def put_file(self, key, path):
+        temp_path = stages.get_temp_path(self.get_cache_path(key))
+        try:
+            stages.clone_file(path, temp_path, self.hardlink)
+        except OSError as e:
+            print("error caching result:", e)
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            return
+        self.add(temp_path, key)
+
+    # moves the temporary file into the cache under key and evicts old entries if the size cap is exceeded
+    def add(self, temp_path, key):
+        try:
+            size = os.path.getsize(temp_path)
+            os.replace(temp_path, self.get_cache_path(key))  # other instances never see half written entries
+        except OSError as e:
+            print("error caching result:", e)
+            return
+
+        with self.lock:
+            self.size += size
+            if self.size > self.max_bytes:
+                self.size = evict_lru(self.directory, self.max_bytes)
+
+
+# passes the outputs on to the given stages.WriteBehind and stores them in the result cache under key
+class CachingWriter:
+    def __init__(self, writer, result_cache, key):
+        self.writer = writer
+        self.result_cache = result_cache
+        self.key = key
+
+    def write(self, path, data):
+        self.result_cache.put(self.key, data)
+        self.writer.write(path, data)
+
+    def write_file(self, temp_path, path):
+        self.result_cache.put_file(self.key, temp_path)
+        self.writer.write_file(temp_path, path)
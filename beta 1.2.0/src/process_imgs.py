@@ -16,18 +16,44 @@ GNU General Public License for more details.
 You should have received a copy of the GNU General Public License
 along with Image Tools.  If not, see <https://www.gnu.org/licenses/>.
 """
+import argparse
+import concurrent.futures
+import contextlib
+import copy
+import csv
+import io
+import json
 import math
 import os
+import sys
+import threading
 
 from PIL import Image, ImageEnhance
 
+import src.archives as archives
+import src.cache as cache
+import src.stages as stages
+import src.tiling as tiling
+import src.watermark as watermark
 from src.values import *
 
+# resampling filters that can be selected for rotations by arbitrary angles
+resampling_filters = [Image.NEAREST, Image.BILINEAR, Image.BICUBIC]
+
+# transpositions that rotate an image counterclockwise by the given multiple of 90 degrees
+right_angle_transpositions = {90: Image.ROTATE_90, 180: Image.ROTATE_180, 270: Image.ROTATE_270}
+
+# formats of the supported output file types
+extension_formats = {"jpg": "JPEG", "jpeg": "JPEG", "png": "PNG", "webp": "WEBP", "tif": "TIFF", "tiff": "TIFF",
+                     "bmp": "BMP", "ppm": "PPM", "pgm": "PPM"}
+
 
 class Params:
     def __init__(self, width=None, height=None, pos=None, left=None, top=None, perc=None, keep_aspect=None,
                  leq_geq=None, contrast=None, saturation=None, brightness=None, sharpness=None, flip_mode=None,
-                 angle=None, img_path=None):
+                 angle=None, img_path=None, resample=None, fillcolor=None, opacity=None, scale=None, scale_base=None,
+                 pattern=None, pattern_angle=None, spacing=None, text=None, font=None, font_size=None, color=None,
+                 boxes=None):
         if width is not None:
             self.width = int(width)
         if height is not None:
@@ -58,6 +84,47 @@ class Params:
             self.angle = angle
         if img_path is not None:
             self.img_path = img_path
+        if resample is not None:
+            self.resample = int(resample)
+        if fillcolor is not None:
+            self.fillcolor = fillcolor
+        if opacity is not None:
+            self.opacity = float(opacity)
+        if scale is not None:
+            self.scale = float(scale)
+        if scale_base is not None:
+            self.scale_base = scale_base
+        if pattern is not None:
+            self.pattern = pattern
+        if pattern_angle is not None:
+            self.pattern_angle = float(pattern_angle)
+        if spacing is not None:
+            self.spacing = float(spacing)
+        if text is not None:
+            self.text = text
+        if font is not None:
+            self.font = font
+        if font_size is not None:
+            self.font_size = int(font_size)
+        if color is not None:
+            self.color = color
+        if boxes is not None:
+            self.boxes = parse_boxes(boxes) if isinstance(boxes, str) else boxes
+
+
+# returns the boxes of the multi region crop given as text, "left,top,width,height;left,top,width,height;...", an empty
+# text means that the boxes are read from a region file next to every image (see load_boxes)
+def parse_boxes(text):
+    return [tuple(int(val) for val in box.split(",")) for box in text.split(";") if box.strip() != ""]
+
+
+# types of the params that are stored as they are by Params, but are numbers in the gui
+param_types = {"pos": int, "keep_aspect": int, "leq_geq": int, "flip_mode": int, "angle": float, "pattern": int}
+
+
+# creates Params from a dict of strings, e.g. given on the command line, unknown names raise a TypeError
+def get_params(values):
+    return Params(**{name: param_types[name](val) if name in param_types else val for name, val in values.items()})
 
 
 # returns all filenames in the given directory (only filenames without path to it)
@@ -110,9 +177,16 @@ def crop_img(img, params):
         return crop_img_variable(img, params)
 
 
-# crops the given image around a predefined position, params includes width, height of the resulting image and pos
-def crop_img_predefined(img, params):
-    img_width, img_height = img.size
+# returns the box (left, top, right, bottom) the crop tool cuts out of an image with img_width and img_height
+def get_crop_box(img_width, img_height, params):
+    if hasattr(params, "pos"):
+        return get_crop_box_predefined(img_width, img_height, params)
+    else:
+        return get_crop_box_variable(img_width, img_height, params)
+
+
+# returns the crop box around a predefined position, params includes width, height of the resulting image and pos
+def get_crop_box_predefined(img_width, img_height, params):
     width = params.width if params.width < img_width else img_width
     height = params.height if params.height < img_height else img_height
 
@@ -121,14 +195,12 @@ def crop_img_predefined(img, params):
     right = left + width
     bottom = top + height
 
-    return img.crop((left, top, right, bottom))
+    return left, top, right, bottom
 
 
-# crops the given image from a given position, params include left, top for the position and width, height of
+# returns the crop box from a given position, params include left, top for the position and width, height of
 # the resulting image
-def crop_img_variable(img, params):
-    img_width, img_height = img.size
-
+def get_crop_box_variable(img_width, img_height, params):
     left = params.left if params.left < img_width else 0
     top = params.top if params.top < img_height else 0
 
@@ -137,133 +209,891 @@ def crop_img_variable(img, params):
 
     right = left + width
     bottom = top + height
-    return img.crop((left, top, right, bottom))
+    return left, top, right, bottom
+
+
+# crops the given image around a predefined position, params includes width, height of the resulting image and pos,
+# uncompressed sources are only read inside the crop box
+def crop_img_predefined(img, params):
+    return tiling.read_region(img, get_crop_box_predefined(img.width, img.height, params))
+
+
+# crops the given image from a given position, params include left, top for the position and width, height of
+# the resulting image, uncompressed sources are only read inside the crop box
+def crop_img_variable(img, params):
+    return tiling.read_region(img, get_crop_box_variable(img.width, img.height, params))
+
+
+# returns the boxes (left, top, width, height) listed in the region file of the image file in path, a json file with a
+# list of [left, top, width, height] lists or of objects with these keys, or a csv file with a row for every box,
+# optionally below a header
+def load_boxes(path, file):
+    name = file.rsplit(".", 1)[0]
+    for extension in region_file_extensions:
+        region_path = os.path.join(path, name + "." + extension)
+        if not os.path.isfile(region_path):
+            continue
+
+        with open(region_path, newline="", encoding="utf-8") as f:
+            if extension == "json":
+                boxes = json.load(f)
+                return [tuple(int(box[key]) for key in ("left", "top", "width", "height")) if isinstance(box, dict)
+                        else tuple(int(val) for val in box) for box in boxes]
+            rows = [row for row in csv.reader(f) if row]
+            if rows and not rows[0][0].strip().lstrip("-").isdigit():  # header
+                rows = rows[1:]
+            return [tuple(int(val) for val in row[:4]) for row in rows]
+
+    raise FileNotFoundError("no region file for {}".format(file))
+
+
+# returns crop Params with a variable position for every region of the multi region crop of the image file in path
+def get_region_params(params, path, file):
+    boxes = params.boxes if params.boxes else load_boxes(path, file)
+    return [Params(left=left, top=top, width=width, height=height) for left, top, width, height in boxes]
 
 
 # resizes the given image by a given percentage, params only include perc
 def resize_img_percentage(img, params):
-    factor = math.sqrt(params.perc / 100)
-    img_width, img_height = img.size
-    width, height = int(img_width * factor), int(img_height * factor)
+    return img.resize(get_size_percentage(img.width, img.height, params))
 
-    return img.resize((width, height))
+
+# returns the size resize_img_percentage scales an image with img_width and img_height to
+def get_size_percentage(img_width, img_height, params):
+    factor = math.sqrt(params.perc / 100)
+    return int(img_width * factor), int(img_height * factor)
 
 
-# resizes the given image to specific dimensions, params include the dimensions (width, height), keep_aspect and leq_geq
+# resizes the given image to specific dimensions, params include the dimensions (width, height), keep_aspect and leq_geq,
+# with keep_aspect and pos, the result has exactly these dimensions: it's filled (>=) by scaling only the box around pos
+# (see get_fill_box) in a single resampling, without cropping a copy first, or fit (<=) onto a canvas in the optional
+# fillcolor at pos
 def resize_img_dimensions(img, params):
-    if not params.keep_aspect:
-        return img.resize((params.width, params.height))
+    if not (params.keep_aspect and hasattr(params, "pos")):
+        return img.resize(get_size_dimensions(img.width, img.height, params))
+
+    if img.mode in ("1", "P"):  # resampled and padded in color
+        img = img.convert("RGBA" if "transparency" in img.info else "RGB")
+    if params.leq_geq:
+        box = get_fill_box(img.width, img.height, params)
+        return img.resize((params.width, params.height), box=box, reducing_gap=resize_reducing_gap)
+
+    fitted = img.resize(get_scaled_size(img.width, img.height, params), reducing_gap=resize_reducing_gap)
+    result = Image.new(fitted.mode, (params.width, params.height), getattr(params, "fillcolor", 0))
+    result.paste(fitted, get_position(params.width, params.height, fitted.width, fitted.height, params.pos))
+    fitted.close()
+    return result
+
+
+# returns the box of an image with img_width and img_height that is scaled to exactly width and height when filling,
+# the largest box with the aspect ratio of the result at pos (see get_position)
+def get_fill_box(img_width, img_height, params):
+    factor = max(params.width / img_width, params.height / img_height)
+    width, height = min(img_width, params.width / factor), min(img_height, params.height / factor)
+    left, top = get_position(img_width, img_height, width, height, params.pos)
+    return left, top, left + width, top + height
+
+
+# returns the size resize_img_dimensions scales an image with img_width and img_height to
+def get_size_dimensions(img_width, img_height, params):
+    if not params.keep_aspect or hasattr(params, "pos"):
+        return params.width, params.height
+    return get_scaled_size(img_width, img_height, params)
+
+
+# returns the size an image with img_width and img_height is scaled to with its aspect ratio, so that it fits into
+# (leq_geq 0) or covers (leq_geq 1) width and height
+def get_scaled_size(img_width, img_height, params):
 
-    img_width, img_height = img.size
     width, height = params.width, params.height
 
     if not params.leq_geq:
         factor = min(width / img_width, height / img_height)
     else:
         factor = max(width / img_width, height / img_height)
-    width, height = int(img_width * factor), int(img_height * factor)
+    return int(img_width * factor), int(img_height * factor)
 
-    return img.resize((width, height))
 
-
-# enhances the given image, params include the values for the contrast, saturation, brightness and sharpness filters
+# enhances the given image, params include the values for the contrast, saturation, brightness and sharpness filters,
+# filters with a factor of 1.0 are skipped, so they neither copy nor convert the image
 def enhance_img(img, params):
-    after_contrast = ImageEnhance.Contrast(img).enhance(params.contrast)
-    after_saturation = ImageEnhance.Color(after_contrast).enhance(params.saturation)
-    after_brightness = ImageEnhance.Brightness(after_saturation).enhance(params.brightness)
-    after_sharpness = ImageEnhance.Sharpness(after_brightness).enhance(params.sharpness)
+    if img.mode in tiling.lut_modes:
+        img = enhance_color(img, params, get_mean(img) if params.contrast != 1.0 else 0)
+    else:
+        if params.contrast != 1.0:
+            img = ImageEnhance.Contrast(img).enhance(params.contrast)
+        if params.saturation != 1.0:
+            img = ImageEnhance.Color(img).enhance(params.saturation)
+        if params.brightness != 1.0:
+            img = ImageEnhance.Brightness(img).enhance(params.brightness)
 
-    return after_sharpness
+    if params.sharpness != 1.0:
+        img = ImageEnhance.Sharpness(img).enhance(params.sharpness)
+
+    return img
+
+
+# returns the mean brightness of img, around which the contrast is changed
+def get_mean(img):
+    if img.mode == "L":
+        return tiling.get_histogram_mean(img.histogram())
+    return tiling.get_histogram_mean(img.convert("L").histogram())
+
+
+# changes contrast, saturation and brightness of an image in one of the tiling.lut_modes like ImageEnhance, contrast
+# and brightness are changed via lookup tables, which saves the full size intermediate images ImageEnhance creates,
+# the contrast is changed around the given mean, so that strips of an image can be enhanced like the whole image
+def enhance_color(img, params, mean):
+    if params.contrast != 1.0:
+        img = tiling.apply_color_lut(img, tiling.get_blend_lut(mean, params.contrast))
+    if params.saturation != 1.0:
+        img = ImageEnhance.Color(img).enhance(params.saturation)
+    if params.brightness != 1.0:
+        img = tiling.apply_color_lut(img, tiling.get_blend_lut(0, params.brightness))
+
+    return img
 
 
 # converts the given image to greyscale, params include nothing
 def greyscale_img(img, params):
+    if img.mode == "L":  # e.g. a jpeg that was decoded to greyscale directly (see get_draft_mode)
+        return img
     return img.convert("L")
 
 
+# returns the mode the decoder should produce for the given tool or None, jpegs can be decoded to greyscale directly,
+# which skips upsampling and converting the color channels
+def get_draft_mode(tool):
+    return "L" if tool == greyscale_img else None
+
+
 # flips the given image either vertically or horizontally, params include an int for this decision
 def flip_img(img, params):
     return img.transpose(Image.FLIP_TOP_BOTTOM if params.flip_mode else Image.FLIP_LEFT_RIGHT)
 
 
-# rotates the given image, params include the rotation angle
+# rotates the given image, params include the rotation angle and optionally the index of the resampling filter (see
+# resampling_filters) and the color for the corners, multiples of 90 degrees are rotated losslessly by transposing
 def rotate_img(img, params):
-    return img.rotate(params.angle, expand=True)
+    angle = params.angle % 360
+    if angle == 0:
+        return img
+    if angle in right_angle_transpositions:
+        return img.transpose(right_angle_transpositions[angle])
 
+    resample = resampling_filters[params.resample] if hasattr(params, "resample") else Image.NEAREST
+    fillcolor = params.fillcolor if hasattr(params, "fillcolor") else None
+    return img.rotate(params.angle, resample=resample, expand=True, fillcolor=fillcolor)
 
-# pastes one image onto another to create a watermark
+
+# composites a watermark image (or text, with font, font_size and color) onto the given image, with the optional
+# opacity (0 to 1) and scale, the watermark is prepared once for all images (see watermark.load_layer) and only the
+# covered region of the image is changed, with pattern, the watermark is repeated diagonally over the whole image
+# instead
 def create_watermark(img, params):
-    img_width, img_height = img.size
-    watermark = Image.open(params.img_path)
-    width, height = watermark.size
+    layer = get_watermark_layer(params, img.width, img.height)
+    left, top = get_watermark_position(img.width, img.height, layer, params)
+    return watermark.composite(img, layer, left, top)
+
+
+# returns the width the watermark is scaled to on an image with img_width and img_height, or None if it keeps its size,
+# with scale, the watermark is as wide as that fraction of the image's width (or of its shorter side, if scale_base is
+# "short")
+def get_watermark_width(params, img_width, img_height):
+    if not hasattr(params, "scale"):
+        return None
+    base = min(img_width, img_height) if getattr(params, "scale_base", "width") == "short" else img_width
+    return max(1, round(base * params.scale))
+
+
+# returns the key of the watermark given by params, a text watermark if there is a text, otherwise the image at img_path
+def get_watermark_key(params):
+    opacity = getattr(params, "opacity", 1.0)
+    if hasattr(params, "text"):
+        return watermark.get_text_key(params.text, getattr(params, "font", None),
+                                      getattr(params, "font_size", watermark_font_size),
+                                      getattr(params, "color", watermark_color), opacity)
+    return watermark.get_image_key(params.img_path, opacity)
+
+
+# returns the prepared watermark for the given params and an image with img_width and img_height, in pattern mode, it
+# covers the whole image and is rotated by pattern_angle and repeated with spacing (see watermark.load_pattern)
+def get_watermark_layer(params, img_width, img_height):
+    key = get_watermark_key(params)
+    width = get_watermark_width(params, img_width, img_height)
+    if getattr(params, "pattern", False):
+        return watermark.load_pattern(key, (img_width, img_height), width,
+                                      getattr(params, "pattern_angle", watermark_pattern_angle),
+                                      getattr(params, "spacing", watermark_pattern_spacing))
+    return watermark.load_layer(key, width)
+
+
+# returns params with the fields in the text of a text watermark filled in for the given file, {name} is the name of
+# the file without extension, only the words that change are rendered again (see watermark.render_text)
+def get_file_params(params, tool, file):
+    if tool != create_watermark or "{name}" not in getattr(params, "text", ""):
+        return params
+    params = copy.copy(params)
+    params.text = params.text.replace("{name}", os.path.splitext(os.path.basename(file))[0])
+    return params
+
+
+# returns the upper left corner of the watermark layer on an image with img_width and img_height
+def get_watermark_position(img_width, img_height, layer, params):
+    if getattr(params, "pattern", False):
+        return 0, 0
     if hasattr(params, "pos"):
-        left, top = get_position(img_width, img_height, width, height, params.pos)
-    else:
-        left, top = params.left, params.top
+        return get_position(img_width, img_height, layer.width, layer.height, params.pos)
+    return params.left, params.top
 
-    img.paste(watermark, (left, top), watermark)  # pass the watermark again, as transparency mask for itself
 
+# returns whether the tool can process an image with the given mode strip by strip, the transparency of images with a
+# transparent color (not an alpha channel) is only kept by tools that don't change the mode
+def is_tileable(tool, params, mode, transparency=False):
+    if transparency and tool != crop_img:
+        return False
+    if tool == enhance_img:
+        return params.sharpness == 1.0 and mode in tiling.lut_modes
+    return tool in (crop_img, greyscale_img, create_watermark)
+
+
+# returns a function processing one horizontal strip of img like the given tool, together with the box of img that
+# has to be read and the mode of the result, the tool has to be tileable (see is_tileable)
+def get_strip_tool(img, tool, params):
+    img_width, img_height = img.size
+    box = (0, 0, img_width, img_height)
+
+    if tool == crop_img:
+        return lambda strip, top: strip, get_crop_box(img_width, img_height, params), img.mode
+    elif tool == greyscale_img:
+        return lambda strip, top: strip.convert("L"), box, "L"
+    elif tool == enhance_img:
+        # the contrast depends on the mean of the whole image, the other enhancements only on the pixel itself
+        mean = tiling.get_mean(img, box) if params.contrast != 1.0 else 0
+        return lambda strip, top: enhance_color(strip, params, mean), box, img.mode
+    elif tool == create_watermark and getattr(params, "pattern", False):
+        # the stamps are composited onto every strip, a pattern of the whole image's size would defeat the strips
+        stamp = watermark.load_stamp(get_watermark_key(params), get_watermark_width(params, img_width, img_height),
+                                     getattr(params, "pattern_angle", watermark_pattern_angle))
+        spacing = getattr(params, "spacing", watermark_pattern_spacing)
+        mode = watermark.get_composite_mode(img)
+        return lambda strip, top: watermark.composite_pattern(strip, stamp, spacing, top), box, mode
+    elif tool == create_watermark:
+        layer = get_watermark_layer(params, img_width, img_height)
+        left, top = get_watermark_position(img_width, img_height, layer, params)
+        mode = watermark.get_composite_mode(img)
+        return lambda strip, strip_top: watermark.composite(strip, layer, left, top - strip_top), box, mode
+
+
+# opens the image at path (or in the given file object) and registers it with the given ExitStack, so that its file
+# handle and pixel data are released when the stack is closed, no matter whether processing the image succeeded,
+# uncompressed images are used in place from their memory mapped file where possible (see tiling.map_img)
+def open_img(stack, path):
+    img = Image.open(path)
+    stack.callback(img.close)
+
+    mapped = tiling.map_img(img)
+    if mapped is not None:
+        stack.callback(mapped.close)
+        return mapped
     return img
 
 
+# runs the tool on img and releases img as soon as the tool returned a new image, so that source and result are only
+# both held in memory while the tool is running
+def apply_tool(img, tool, params):
+    result = tool(img, params)
+    if result is not img:
+        img.close()
+    return result
+
+
+# returns whether the tiled route writes a result in mode strip by strip, which is possible for pngs in the modes the
+# strip writer stores without converting them (see tiling.PngStripWriter) and without a transparent color
+def is_streamed(extension, mode, transparency=False):
+    return extension.lower() == "png" and mode in tiling.png_color_types and not transparency
+
+
+# processes img strip by strip with the given tool and writes the result to out_path, pngs are written strip by strip
+# as well (see is_streamed), other formats and modes are assembled first
+def process_img_tiled(img, params, tool, out_path, extension):
+    strip_tool, box, mode = get_strip_tool(img, tool, params)
+    size = (box[2] - box[0], box[3] - box[1])
+    if is_streamed(extension, mode, "transparency" in img.info):
+        tiling.process_strips(img, box, strip_tool, tiling.PngStripWriter(out_path, size, mode, img.info))
+    else:
+        writer = tiling.ImageStripWriter(size, mode)
+        with contextlib.closing(writer.image):
+            writer.image.info = img.info
+            if mode == "P":  # the strips keep the indices of the source
+                writer.image.putpalette(img.getpalette())
+            tiling.process_strips(img, box, strip_tool, writer)
+            try:
+                save_img(writer.image, out_path, extension)
+            except BaseException:
+                if os.path.exists(out_path):
+                    os.remove(out_path)
+                raise
+
+
+# saves the given image to path (or into the given file object) with the settings for the given extension, returns
+# False for unsupported extensions
+def save_img(img, path, extension):
+    if extension.lower() == "jpg" or extension.lower() == "jpeg":
+        if "exif" in img.info:
+            img.save(path, "JPEG", quality=95, subsampling=0, exif=img.info["exif"])
+        else:
+            img.save(path, "JPEG", quality=95, subsampling=0)
+    elif extension.lower() == "png":
+        if "exif" in img.info:
+            img.save(path, "PNG", quality=95, compress_level=6, exif=img.info["exif"])
+        else:  # compress level 6 is default value, 9 is strongest and 0 no compression
+            img.save(path, "PNG", quality=95, compress_level=6)
+    elif extension.lower() == "webp":
+        if "exif" in img.info:
+            img.save(path, "WEBP", quality=90, method=4, exif=img.info["exif"])
+        else:  # method 4 is the default trade-off between speed and size, 6 is the slowest and smallest
+            img.save(path, "WEBP", quality=90, method=4)
+    elif extension.lower() in ("tif", "tiff", "bmp", "ppm", "pgm"):  # stored uncompressed
+        img.save(path, extension_formats[extension.lower()])
+    else:
+        return False
+
+    return True
+
+
+# header information of an image file, read without decoding the image
+class Probe:
+    def __init__(self, file, file_size, img):
+        self.file = file
+        self.file_size = file_size
+        self.format = img.format
+        self.size = img.size
+        self.mode = img.mode
+        self.transparency = "transparency" in img.info  # a transparent color or palette entry
+        self.mapped = tiling.get_mapped_layout(img) is not None  # pixels are used in place from the file
+        # regions can be read without decoding the whole image (see tiling.read_region)
+        self.striped = tiling.get_raw_strips(img) is not None or tiling.get_tiff_blocks(img) is not None
+        # pillow stores multi channel pixels in 4 bytes
+        self.memory = img.width * img.height * (1 if len(img.getbands()) == 1 else 4)
+
+
+# reads only the header of the given file in path (or of the member file of the given archive, see
+# archives.open_archive), returns a Probe or None if the file is not a readable image
+def probe_img(path, file, archive=None):
+    try:
+        if archive is None:
+            with Image.open(os.path.join(path, file)) as img:
+                return Probe(file, os.path.getsize(os.path.join(path, file)), img)
+        with archive.open(file) as f, Image.open(f) as img:
+            probe = Probe(file, archive.get_size(file), img)
+        probe.mapped = False  # members are read into memory, so they can't be mapped
+        return probe
+    except Exception as e:
+        print("error probing image:", e)
+        return None
+
+
+# returns whether the file has a supported extension, reports the files that haven't
+def is_supported(file):
+    extension = file.rsplit(".", 1)[1] if "." in file else ""
+    if extension.lower() not in supported_extensions:
+        print("unsupported filetype:", extension)
+        return False
+    return True
+
+
+# probes the headers of all files with a supported extension in parallel and returns the probes of the readable images,
+# sorted largest first, so that the workers processing them finish at about the same time
+def probe_imgs(path, files, workers, archive=None):
+    supported = [file for file in files if is_supported(file)]
+    with concurrent.futures.ThreadPoolExecutor(workers) as pool:
+        probes = [probe for probe in pool.map(lambda file: probe_img(path, file, archive), supported)
+                  if probe is not None]
+
+    probes.sort(key=lambda probe: probe.memory, reverse=True)
+    return probes
+
+
+# returns whether the tool would return an image with the probed header unchanged
+def is_noop(probe, tool, params):
+    width, height = probe.size
+    if tool == crop_img:
+        return get_crop_box(width, height, params) == (0, 0, width, height)
+    elif tool == resize_img_percentage:
+        return get_size_percentage(width, height, params) == probe.size
+    elif tool == resize_img_dimensions:
+        return get_size_dimensions(width, height, params) == probe.size
+    elif tool == enhance_img:
+        return params.contrast == params.saturation == params.brightness == params.sharpness == 1.0
+    elif tool == rotate_img:
+        return params.angle % 360 == 0
+
+    return False
+
+
+# returns the mode of the result the tiled route creates from the image of the given probe (see get_strip_tool)
+def get_tiled_mode(probe, tool):
+    if tool == greyscale_img:
+        return "L"
+    if tool == create_watermark and probe.mode not in watermark.composite_modes:
+        return "RGBA" if "A" in probe.mode else "RGB"  # transparent colors aren't tiled (see is_tileable)
+    return probe.mode
+
+
+# returns whether the tiled route needs less memory than the full one for the image of the given probe, which is the
+# case if the source can be read in regions or the result is written strip by strip
+def is_tiling_worth(probe, tool):
+    extension = probe.file.rsplit(".", 1)[-1]
+    return probe.striped or is_streamed(extension, get_tiled_mode(probe, tool), probe.transparency)
+
+
+# decides how the image of the given probe is processed:
+# "noop" if the tool wouldn't change the image, so the source is copied (see copy_img),
+# "tiled" if the image is processed strip by strip (see tiled in process_imgs), large images only if that needs less
+# memory (see is_tiling_worth),
+# "draft" if the image is a jpeg that is scaled down far enough to let the decoder do a part of the scaling,
+# "full" otherwise
+def get_route(probe, tool, params, tiled):
+    if is_noop(probe, tool, params):
+        return "noop"
+    if tiled is None:
+        tiled = probe.memory > tiled_threshold and is_tiling_worth(probe, tool)
+    if tiled and is_tileable(tool, params, probe.mode, probe.transparency):
+        return "tiled"
+    if probe.format == "JPEG" and tool in (resize_img_percentage, resize_img_dimensions):
+        width, height = get_resize_size(probe, tool, params)
+        if width * 4 <= probe.size[0] and height * 4 <= probe.size[1]:
+            return "draft"
+
+    return "full"
+
+
+# returns the size the resize tool scales the image of the given probe to
+def get_resize_size(probe, tool, params):
+    if tool == resize_img_percentage:
+        return get_size_percentage(probe.size[0], probe.size[1], params)
+    return get_size_dimensions(probe.size[0], probe.size[1], params)
+
+
+# returns the number of bytes of the watermark pattern for the image of the given probe on the full route, which covers
+# the whole image (see get_watermark_layer), single watermarks are small compared to the image
+def get_layer_memory(probe, tool, params):
+    if tool == create_watermark and getattr(params, "pattern", False):
+        return probe.size[0] * probe.size[1] * 4
+    return 0
+
+
+# returns the estimated number of bytes needed to process the image of the given probe on the given route
+def get_memory_estimate(probe, tool, params, route):
+    if route == "noop":
+        return 0
+    if probe.mapped:  # the source stays in the page cache, only the result is created
+        return probe.memory + (get_layer_memory(probe, tool, params) if route != "tiled" else 0)
+    if route == "tiled":
+        # sources that can't be read in regions are decoded as a whole, results that aren't written strip by strip
+        # are assembled as a whole before they are encoded
+        source = 2 * tiled_strip_bytes if probe.striped else probe.memory
+        mode = get_tiled_mode(probe, tool)
+        if is_streamed(probe.file.rsplit(".", 1)[-1], mode, probe.transparency):
+            return source
+        width, height = probe.size
+        if tool == crop_img:
+            box = get_crop_box(width, height, params)
+            width, height = box[2] - box[0], box[3] - box[1]
+        return source + width * height * (1 if Image.getmodebands(mode) == 1 else 4)
+    if probe.format == "JPEG" and get_draft_mode(tool) == "L":
+        return probe.size[0] * probe.size[1]  # decoded to greyscale directly, so no result is created
+    return 2 * probe.memory + get_layer_memory(probe, tool, params)  # source, result and watermark
+
+
+# limits the estimated memory of all images processed at the same time, an image larger than the whole budget is
+# processed on its own
+class MemoryBudget:
+    def __init__(self, budget):
+        self.budget = budget
+        self.used = 0
+        self.condition = threading.Condition()
+
+    def acquire(self, amount):
+        with self.condition:
+            while self.used > 0 and self.used + amount > self.budget:
+                self.condition.wait()
+            self.used += amount
+
+    def release(self, amount):
+        with self.condition:
+            self.used -= amount
+            self.condition.notify_all()
+
+
+# processes the image of the given probe on the given route, source is the path of the image or a file object with its
+# content, the encoded result is handed to the writer, images processed strip by strip are written to a temporary file
+# directly, which the writer then moves to out_path
+def process_img(source, probe, params, tool, out_path, route, writer):
+    params = get_file_params(params, tool, probe.file)
+    extension = out_path.rsplit(".", 1)[1]
+    if route == "noop" and extension_formats.get(extension.lower()) == probe.format:
+        copy_img(source, out_path, writer)
+        return
+
+    with contextlib.ExitStack() as stack:  # releases all images of this file, also on errors
+        img = open_img(stack, source)
+        if get_draft_mode(tool) is not None:
+            img.draft(get_draft_mode(tool), img.size)  # only changes the decoding of jpegs
+
+        if route == "tiled":
+            temp_path = stages.get_temp_path(out_path)
+            process_img_tiled(img, params, tool, temp_path, extension)
+            writer.write_file(temp_path, out_path)
+            return
+
+        if route == "noop":  # the file extension doesn't match the format, so it has to be converted
+            img_cropped = img
+        elif route == "draft":
+            # the jpeg decoder scales down by up to 1/8 while decoding, like Image.thumbnail it stops at twice the
+            # target size, so that the final resampling keeps its quality
+            width, height = get_resize_size(probe, tool, params)
+            img.draft(None, (width * 2, height * 2))
+            if hasattr(params, "pos"):  # exact dimensions, which are fit or filled from the drafted size
+                img_cropped = resize_img_dimensions(img, params)
+            else:
+                img_cropped = img.resize((width, height))
+            img.close()
+        else:
+            img_cropped = apply_tool(img, tool, params)
+        stack.callback(img_cropped.close)
+
+        output = io.BytesIO()
+        save_img(img_cropped, output, extension)
+        writer.write(out_path, output.getvalue())
+
+
+# an output of the multi variant mode (see process_imgs), the result of the tool is scaled down to width (None keeps its
+# size, smaller images are never scaled up) and written with suffix as the given file type (None keeps the type of the
+# source)
+class Variant:
+    def __init__(self, suffix, width=None, extension=None):
+        self.suffix = suffix
+        self.width = int(width) if width is not None else None
+        self.extension = extension
+
+
+# returns the size a variant scales an image with img_width and img_height to, always computed from the full size, so
+# that the rounding errors of the previous variants don't add up
+def get_variant_size(img_width, img_height, width):
+    if width is None or width >= img_width:
+        return img_width, img_height
+    return width, max(1, round(img_height * width / img_width))
+
+
+# returns img in a mode that can be written as jpeg (without alpha channel or palette), the other file types can be
+# written in all modes of the results
+def get_jpeg_img(img):
+    if img.mode in ("RGB", "L", "CMYK"):
+        return img
+    return img.convert("L" if img.mode in ("1", "L", "LA") else "RGB")
+
+
+# lets the jpeg decoder decode img in the mode the tool needs (see get_draft_mode) and, for tools that don't depend on
+# the size of the image, scaled down towards width, the largest variant, both in a single draft, because the decoder
+# ignores any further draft
+def draft_variants(img, tool, width):
+    if tool in (enhance_img, greyscale_img, flip_img) and width is not None:
+        img.draft(get_draft_mode(tool) or img.mode, (width * 2, 1))
+    elif get_draft_mode(tool) is not None:
+        img.draft(get_draft_mode(tool), img.size)
+
+
+# creates a Variant from a text "suffix,width,type" given on the command line, width and type are optional
+def parse_variant(text):
+    suffix, width, extension = (text.split(",") + ["", ""])[:3]
+    return Variant(suffix, width or None, extension or None)
+
+
+# processes the image of the given probe once and writes all variants of the result, with out_base + variant suffix as
+# their paths, the variants are scaled down largest first, each from the previous one instead of the full result, so
+# that every resampling works on as few pixels as possible, all variants are encoded before the first one is written,
+# so that an image whose variants can't all be encoded leaves no partial set of outputs behind
+def process_img_variants(source, probe, params, tool, out_base, extension, variants, writer):
+    params = get_file_params(params, tool, probe.file)
+    variants = sorted(variants, key=lambda variant: variant.width or math.inf, reverse=True)
+
+    with contextlib.ExitStack() as stack:  # releases all images of this file, also on errors
+        img = open_img(stack, source)
+        draft_variants(img, tool, variants[0].width)
+
+        result = apply_tool(img, tool, params)
+        stack.callback(result.close)
+        full_size = result.size
+
+        outputs = []
+        for variant in variants:
+            size = get_variant_size(full_size[0], full_size[1], variant.width)
+            if size[0] < result.width:
+                result = result.resize(size)
+                stack.callback(result.close)
+
+            variant_extension = variant.extension or extension
+            variant_img = result
+            if variant_extension.lower() in ("jpg", "jpeg"):
+                variant_img = get_jpeg_img(result)
+                if variant_img is not result:
+                    stack.callback(variant_img.close)
+            output = io.BytesIO()
+            if not save_img(variant_img, output, variant_extension):
+                raise ValueError("unsupported file type: {}".format(variant_extension))
+            outputs.append((out_base + variant.suffix + "." + variant_extension, output.getvalue()))
+
+    for out_path, data in outputs:
+        writer.write(out_path, data)
+
+
+# decodes the image of the given probe once and writes every region (crop Params, see get_region_params) to out_base
+# + region_suffix, the regions are cut out one after the other (only their rows are read from uncompressed sources),
+# but encoded in parallel by the encoders pool
+def process_img_regions(source, probe, regions, out_base, extension, writer, encoders):
+    def encode(region, out_path):
+        try:
+            output = io.BytesIO()
+            if not save_img(region, output, extension):
+                raise ValueError("unsupported file type: {}".format(extension))
+            writer.write(out_path, output.getvalue())
+        finally:
+            region.close()
+
+    with contextlib.ExitStack() as stack:  # releases all images of this file, also on errors
+        img = open_img(stack, source)
+        # decoded once for all regions, unless only the rows or blocks inside the regions can be read
+        if not probe.mapped and tiling.get_raw_strips(img) is None and tiling.get_tiff_blocks(img) is None:
+            img.load()
+
+        futures = []
+        try:
+            for index, params in enumerate(regions, 1):
+                region = crop_img_variable(img, params)
+                out_path = out_base + region_suffix.format(index) + "." + extension
+                futures.append(encoders.submit(encode, region, out_path))
+        finally:
+            for future in futures:  # the source has to be kept until all regions are encoded
+                future.result()
+
+
+# hands the unchanged source (its path or a file object with its content) to the writer instead of decoding and
+# encoding it again, which would only lose quality, files are reflinked or copied or, with noop_hardlink, hardlinked
+def copy_img(source, out_path, writer):
+    if not isinstance(source, str):
+        source.seek(0)
+        writer.write(out_path, source.read())
+        return
+    if os.path.abspath(source) == os.path.abspath(out_path):  # written to the source itself, which stays as it is
+        return
+
+    temp_path = stages.get_temp_path(out_path)
+    try:
+        stages.clone_file(source, temp_path, noop_hardlink)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    writer.write_file(temp_path, out_path)
+
+
 # processes all images in the given path, passes the params to the wanted tool and saves the new images into
-# the output directory
-def process_imgs(path, params, tool, out_dir, lang, suffix):
-    counter = 0
+# the output directory, the images are probed first (see get_route) and then processed by a pool of workers, largest
+# first and limited by memory_budget, reading and writing overlap with the processing: the files are read ahead by a
+# stages.Prefetcher and the results are written atomically by a stages.WriteBehind with the given durability,
+# progress is called with the number of finished and all images after each image,
+# tiled decides which images are processed strip by strip: None for images above tiled_threshold, True or False for all,
+# with a cache.ResultCache, outputs of sources that were processed the same way before are taken from the cache,
+# with a list of Variants, every image is decoded and processed once and all variants of the result are written,
+# the crop tool with boxes (see parse_boxes) decodes every image once and writes all of its regions,
+# path may also be a zip or tar archive, whose images are read without extracting it and written to out_dir with the
+# folders of the archive, the members of compressed tars can only be read in order, so they are probed and processed
+# while the archive is streamed and progress gets None for the number of all images,
+# out_dir may also be the path of a zip or tar archive or a binary file object for a tar stream (see
+# archives.is_archive_output), into which all outputs are written with the names they would have in a folder
+def process_imgs(path, params, tool, out_dir, lang, suffix, tiled=None, workers=None, progress=None,
+                 durability=default_durability, result_cache=None, variants=None):
     path = r"{}".format(path)
-    if os.path.isfile(path):
+    archive = archives.open_archive(path)
+    if archive is not None and archive.seekable:
+        files = archive.get_filenames()
+        path = os.path.split(path)[0]
+    elif archive is not None:
+        files = []
+        path = os.path.split(path)[0]
+    elif os.path.isfile(path):
         files = [os.path.split(path)[1]]
         path = os.path.split(path)[0]
     else:
         files = get_filenames(path)
 
-    if not os.path.exists(out_dir):
+    writer = None
+    if archives.is_archive_output(out_dir):
+        writer = archives.ArchiveWriter(out_dir, durability=durability)
+        out_dir = writer.directory  # the outputs are named relative to it
+    elif not os.path.exists(out_dir):
         os.mkdir(out_dir)
 
     tool = get_tool_method(tool, lang)
-
-    for file in files:
+    workers = workers or os.cpu_count() or 1
+    regions = tool == crop_img and hasattr(params, "boxes")
+    if regions:  # the region files are no images
+        files = [file for file in files if file.rsplit(".", 1)[-1].lower() not in region_file_extensions]
+    probes = probe_imgs(path, files, workers, archive)
+    encoders = concurrent.futures.ThreadPoolExecutor(workers) if regions else None
+    budget = MemoryBudget(memory_budget)
+    lock = threading.Lock()
+    finished = [0, 0]  # finished images, successfully processed images
+
+    def get_job_route(probe):
+        if regions:
+            return "regions"
+        return get_route(probe, tool, params, tiled) if not variants else "variants"
+
+    # probes a member of a streamed archive, returns its job or None if it is no readable image
+    def get_stream_job(file, data):
+        if not is_supported(file) or (regions and file.rsplit(".", 1)[-1].lower() in region_file_extensions):
+            return None
         try:
-            img = Image.open(os.path.join(path, file))
-            img_cropped = tool(img, params)
-
-            if not img_cropped:
-                continue
+            with Image.open(io.BytesIO(data)) as img:
+                probe = Probe(file, len(data), img)
+        except Exception as e:
+            print("error probing image:", e)
+            return None
+        probe.mapped = False
+        return probe, get_job_route(probe)
+
+    # images processed strip by strip are read lazily from disk, unchanged images are copied and uncompressed images
+    # are memory mapped, so none of them are prefetched, members of archives are always read into memory
+    jobs = []
+    for probe in probes:
+        route = get_job_route(probe)
+        if archive is not None:
+            prefetch = probe.file_size <= prefetch_max_bytes
+        else:
+            prefetch = route not in ("tiled", "noop") and not probe.mapped and probe.file_size <= prefetch_max_bytes
+        jobs.append(((probe, route), probe.file if archive is not None else os.path.join(path, probe.file), prefetch))
+    if archive is not None and not archive.seekable:
+        prefetcher = archives.StreamReader(archive, get_stream_job)
+    elif archive is not None:
+        prefetcher = stages.Prefetcher(jobs, read=archive.read)
+    else:
+        prefetcher = stages.Prefetcher(jobs)
+    if writer is None:
+        writer = stages.WriteBehind(durability=durability)
+
+    def work():
+        while True:
+            item = prefetcher.get()
+            if item is None:
+                return
+            (probe, route), data = item
+            source = None
+            name, extension = probe.file.rsplit(".", 1)
+            out_path = os.path.join(out_dir, name + suffix + "." + extension)
+
+            memory = get_memory_estimate(probe, tool, params, route)
+            budget.acquire(memory)
+            try:
+                if archive is not None:
+                    if data is None:  # too large to be read ahead
+                        data = archive.read(probe.file)
+                    os.makedirs(os.path.dirname(out_path), exist_ok=True)  # folders of the archive
+                source = io.BytesIO(data) if data is not None else os.path.join(path, probe.file)
+                if route == "regions":
+                    process_img_regions(source, probe, get_region_params(params, path, probe.file),
+                                        os.path.join(out_dir, name + suffix), extension, writer, encoders)
+                elif route == "variants":
+                    process_img_variants(source, probe, params, tool, os.path.join(out_dir, name + suffix), extension,
+                                         variants, writer)
+                elif result_cache is not None and route != "noop":
+                    # with the text of the watermark for this file, which may contain its name
+                    key = result_cache.get_key(data if data is not None else source, tool,
+                                               get_file_params(params, tool, probe.file), extension)
+                    temp_path = stages.get_temp_path(out_path)
+                    if result_cache.get(key, temp_path):
+                        writer.write_file(temp_path, out_path)
+                    else:
+                        process_img(source, probe, params, tool, out_path, route,
+                                    cache.CachingWriter(writer, result_cache, key))
+                else:
+                    process_img(source, probe, params, tool, out_path, route, writer)
+                success = True
+            except Exception as e:
+                print("error processing image:", e)
+                success = False
+            finally:
+                budget.release(memory)
+                del item, data, source  # don't hold the prefetched file while waiting for the next one
+
+            with lock:
+                finished[0] += 1
+                finished[1] += success
+                if progress is not None:
+                    progress(finished[0], len(probes) if archive is None or archive.seekable else None)
+
+    with concurrent.futures.ThreadPoolExecutor(workers) as pool:
+        for _ in range(workers):
+            pool.submit(work)
+    if encoders is not None:
+        encoders.shutdown()
+    writer.close()
+    if archive is not None:
+        archive.close()
+
+    counter = finished[1] - writer.failed
+    print("Processed", counter, "images.")
+    return counter
 
-            name, extension = file.rsplit(".", 1)
 
-            if extension.lower() == "jpg" or extension.lower() == "jpeg":
-                if "exif" in img_cropped.info:
-                    img_cropped.save(os.path.join(out_dir, name + suffix + "." + extension), quality=95, subsampling=0,
-                                     exif=img_cropped.info["exif"])
-                else:
-                    img_cropped.save(os.path.join(out_dir, name + suffix + "." + extension), quality=95, subsampling=0)
-            elif extension.lower() == "png":
-                if "exif" in img_cropped.info:
-                    img_cropped.save(os.path.join(out_dir, name + suffix + "." + extension), quality=95,
-                                     compress_level=6, exif=img_cropped.info["exif"])
-                else:  # compress level 6 is default value, 9 is strongest and 0 no compression
-                    img_cropped.save(os.path.join(out_dir, name + suffix + "." + extension), quality=95,
-                                     compress_level=6)
-            else:
-                print("unsupported filetype:", extension)
-                continue
+# returns a copy of the crop params with all pixel values scaled by factor, so that cropping a downscaled image
+# covers the same region as cropping the original one
+def scale_crop_params(params, factor):
+    scaled = copy.copy(params)
+    scaled.width = max(1, round(params.width * factor))
+    scaled.height = max(1, round(params.height * factor))
+    if hasattr(params, "left"):
+        scaled.left = round(params.left * factor)
+        scaled.top = round(params.top * factor)
+    return scaled
 
-            counter += 1
-            img.close()
-            img_cropped.close()
 
-        except Exception as e:
-            print("error processing image:", e)
+# returns the name and content of the first member of the archive (see archives.open_archive) with a supported
+# extension, or None and None if there is none, and closes the archive
+def read_first_img(archive):
+    def is_img(file):
+        return "." in file and file.rsplit(".", 1)[1].lower() in supported_extensions
 
-    print("Processed", counter, "images.")
-    return counter
+    try:
+        if archive.seekable:
+            for file in archive.get_filenames():
+                if is_img(file):
+                    return file, archive.read(file)
+        else:
+            for file, data in archive.stream():
+                if is_img(file):
+                    return file, data
+        return None, None
+    finally:
+        archive.close()
 
 
-# returns a processed image instance for previewing
-def preview_img(path, params, tool, lang, window, new_window):
+# returns a processed image instance for previewing, the source is taken from the thumbnail cache if one is given,
+# archives are previewed with their first image, returns None if there is nothing to preview
+def preview_img(path, params, tool, lang, window, new_window, thumbnail_cache=None):
     path = r"{}".format(path)
-    if os.path.isfile(path):
+    archive = archives.open_archive(path)
+    data = None
+    if archive is not None:
+        file, data = read_first_img(archive)
+        if file is None:
+            print("no image in archive:", path)
+            return None
+        files = [file]
+        path = os.path.split(path)[0]
+    elif os.path.isfile(path):
         files = [os.path.split(path)[1]]
         path = os.path.split(path)[0]
     else:
@@ -271,14 +1101,32 @@ def preview_img(path, params, tool, lang, window, new_window):
 
     tool = get_tool_method(tool, lang)
 
+    if new_window:  # use standard size if the window was newly created, to prevent the (200, 200) bug
+        width, height = dimensions_preview
+    else:
+        width, height = window.winfo_width(), window.winfo_height()
+
     try:
-        img = Image.open(os.path.join(path, files[0]))
-        img = tool(img, params)
-        if new_window:  # use standard size if the window was newly created, to prevent the (200, 200) bug
-            params = Params(width=dimensions_preview[0], height=dimensions_preview[1], keep_aspect=True, leq_geq=0)
-        else:
-            params = Params(width=window.winfo_width(), height=window.winfo_height(), keep_aspect=True, leq_geq=0)
-        return resize_img_dimensions(img, params)
+        if tool == crop_img and hasattr(params, "boxes"):  # the first region of the multi region crop
+            params = get_region_params(params, path, files[0])[0]
+
+        with contextlib.ExitStack() as stack:
+            # the watermark is pasted in its original size at pixel positions (unless scaled relative to the image and
+            # placed at a predefined position or repeated), so it needs the source in its original size as well
+            relative = hasattr(params, "scale") and (hasattr(params, "pos") or getattr(params, "pattern", False))
+            if thumbnail_cache is not None and data is None and (tool != create_watermark or relative):
+                img, factor = thumbnail_cache.get(os.path.join(path, files[0]), max(width, height))
+                stack.callback(img.close)
+                if tool == crop_img:
+                    params = scale_crop_params(params, factor)
+            else:
+                img = open_img(stack, io.BytesIO(data) if data is not None else os.path.join(path, files[0]))
+                if get_draft_mode(tool) is not None:
+                    img.draft(get_draft_mode(tool), img.size)
+            img = apply_tool(img, tool, get_file_params(params, tool, files[0]))
+            stack.callback(img.close)
+            params = Params(width=width, height=height, keep_aspect=True, leq_geq=0)
+            return resize_img_dimensions(img, params)
 
     except Exception as e:
         print("error previewing image:", e)
@@ -303,4 +1151,42 @@ def get_tool_method(val, lang):
     elif val == get_ui_text("tool_options", lang)[7]:
         return create_watermark
 
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Processes the images of a folder or archive, e.g. into a tar stream: "
+                                                 "python -m src.process_imgs imgs - 'Flip images' flip_mode=0 "
+                                                 "| tar -x")
+    parser.add_argument("input", help="image file, folder or zip/tar archive")
+    parser.add_argument("output", help="destination folder, zip/tar archive or - for a tar stream on stdout")
+    parser.add_argument("tool", choices=get_ui_text("tool_options", "EN"), help="tool to apply")
+    parser.add_argument("params", nargs="*", metavar="name=value", help="tool parameters, named like in Params")
+    parser.add_argument("--suffix", default=get_ui_text("default_suffix", "EN"))
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--durability", choices=durability_modes, default=default_durability)
+    parser.add_argument("--variant", action="append", metavar="suffix,width,type",
+                        help="write a variant of every result instead, scaled down to width and as type (both "
+                             "optional), can be given several times, e.g. --variant _l --variant _s,200,jpg")
+    args = parser.parse_args(args)
+
+    try:
+        params = get_params(dict(param.split("=", 1) for param in args.params))
+    except (TypeError, ValueError) as e:
+        parser.error("invalid tool parameters: {}".format(e))
+    try:
+        variants = [parse_variant(variant) for variant in args.variant] if args.variant else None
+    except ValueError as e:
+        parser.error("invalid variant: {}".format(e))
+
+    with contextlib.ExitStack() as stack:
+        output = args.output
+        if output == "-":
+            output = sys.stdout.buffer
+            stack.enter_context(contextlib.redirect_stdout(sys.stderr))  # keeps the messages out of the tar stream
+        process_imgs(args.input, params, args.tool, output, "EN", args.suffix, workers=args.workers,
+                     durability=args.durability, variants=variants)
+
+
+if __name__ == "__main__":
+    main()
+
 # process_imgs(r"C:\Users\Jonas\Desktop\imgs", Params(200, 200), crop_img_center, "_crop", False)
@@ -0,0 +1,237 @@
+"""
+Copyright © 2021 Jonas Wombacher
+
+This file is part of Image Tools.
+
+Image Tools is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Image Tools is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Image Tools.  If not, see <https://www.gnu.org/licenses/>.
+"""
+import argparse
+import concurrent.futures
+import contextlib
+import math
+import os
+import threading
+
+from PIL import Image
+
+import src.process_imgs as process
+import src.stages as stages
+import src.tiling as tiling
+from src.values import *
+
+dzi_template = """<?xml version="1.0" encoding="UTF-8"?>
+<Image xmlns="http://schemas.microsoft.com/deepzoom/2008" TileSize="{}" Overlap="0" Format="{}">
+    <Size Width="{}" Height="{}"/>
+</Image>
+"""
+
+
+# returns the image with bottom appended below top (which may be None)
+def append_rows(top, bottom):
+    if top is None or top.height == 0:
+        return bottom
+    img = Image.new(bottom.mode, (bottom.width, top.height + bottom.height))
+    img.paste(top, (0, 0))
+    img.paste(bottom, (0, top.height))
+    return img
+
+
+# returns the rows of img from top to bottom
+def get_rows(img, top, bottom):
+    return img.crop((0, top, img.width, bottom))
+
+
+# writes the tiles of a pyramid in parallel, existing tiles of an interrupted run are kept, so that a pyramid can be
+# resumed, at most a few tiles per worker wait to be written
+class TileWriter:
+    def __init__(self, directory, layout, extension, workers):
+        self.directory = directory
+        self.layout = layout
+        self.extension = extension
+        self.pool = concurrent.futures.ThreadPoolExecutor(workers)
+        self.slots = threading.Semaphore(4 * workers)
+        self.lock = threading.Lock()
+        self.errors = []
+        self.written = 0
+        self.skipped = 0
+
+    # returns the path of a tile, levels are counted from the smallest level (a single pixel) upwards
+    def get_tile_path(self, level, column, row):
+        if self.layout == "xyz":
+            return os.path.join(self.directory, str(level), str(column), "{}.{}".format(row, self.extension))
+        return os.path.join(self.directory, str(level), "{}_{}.{}".format(column, row, self.extension))
+
+    def write(self, tile, level, column, row):
+        path = self.get_tile_path(level, column, row)
+        if os.path.exists(path):
+            self.skipped += 1
+            return
+
+        self.slots.acquire()
+        future = self.pool.submit(self.save, tile, path)
+        future.add_done_callback(lambda _: self.slots.release())
+
+    # saves the tile under a temporary name first, so that a resumed run never keeps half written tiles
+    def save(self, tile, path):
+        temp_path = stages.get_temp_path(path)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            process.save_img(tile, temp_path, self.extension)
+            os.replace(temp_path, path)
+            with self.lock:
+                self.written += 1
+        except Exception as e:
+            with self.lock:
+                self.errors.append(e)
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def close(self):
+        self.pool.shutdown()
+
+
+# a level of the pyramid, which gets the rows of its image band by band from top to bottom, cuts them into tiles and
+# hands them to the next smaller level reduced by 2, so that no level is ever held in memory as a whole
+class PyramidLevel:
+    def __init__(self, level, tile_size, writer, next_level):
+        self.level = level
+        self.tile_size = tile_size
+        self.writer = writer
+        self.next_level = next_level
+        self.row = 0  # row of the next tiles
+        self.untiled = None  # rows that don't fill a row of tiles yet
+        self.unreduced = None  # odd row that is reduced together with the first row of the next band
+
+    def add(self, band):
+        self.untiled = append_rows(self.untiled, band)
+        while self.untiled.height >= self.tile_size:
+            self.write_tiles(get_rows(self.untiled, 0, self.tile_size))
+            self.untiled = get_rows(self.untiled, self.tile_size, self.untiled.height)
+
+        if self.next_level is not None:
+            self.unreduced = append_rows(self.unreduced, band)
+            even = self.unreduced.height - self.unreduced.height % 2
+            if even > 0:
+                self.next_level.add(get_rows(self.unreduced, 0, even).reduce(2))
+                self.unreduced = get_rows(self.unreduced, even, self.unreduced.height)
+
+    def write_tiles(self, rows):
+        for column, left in enumerate(range(0, rows.width, self.tile_size)):
+            tile = rows.crop((left, 0, min(left + self.tile_size, rows.width), rows.height))
+            self.writer.write(tile, self.level, column, self.row)
+        self.row += 1
+
+    # writes the last (partial) row of tiles of this and all smaller levels
+    def finish(self):
+        if self.untiled is not None and self.untiled.height > 0:
+            self.write_tiles(self.untiled)
+        if self.next_level is not None:
+            if self.unreduced is not None and self.unreduced.height > 0:
+                self.next_level.add(self.unreduced.reduce(2))
+            self.next_level.finish()
+
+
+# returns the mode the tiles of an image with the given mode are written in for the given file type
+def get_tile_mode(mode, extension):
+    if extension.lower() in ("jpg", "jpeg"):
+        return "L" if mode in ("1", "L") else "RGB"
+    if mode in tiling.png_color_types:
+        return mode
+    return "RGBA" if "A" in mode or mode == "P" else "RGB"
+
+
+# builds a zoomable tile pyramid of the image at path in out_dir: layout "dzi" writes a deep zoom image (name.dzi and
+# the tiles in name_files/level/column_row.extension), "xyz" writes the tiles to name/level/column/row.extension,
+# level 0 is a single pixel, every further level doubles the size up to the full image, the optional tool and params
+# are applied first, the crop tool only reads the cropped box, the pyramid is resumed if it was interrupted before,
+# returns the number of tiles that were written
+def build_pyramid(path, out_dir, name=None, tile_size=pyramid_tile_size, extension="jpg", layout="dzi", tool=None,
+                  params=None, workers=None):
+    name = name or os.path.splitext(os.path.basename(path))[0]
+    if layout == "dzi":
+        directory = os.path.join(out_dir, name + "_files")
+        descriptor = os.path.join(out_dir, name + ".dzi")
+    else:
+        directory = os.path.join(out_dir, name)
+        descriptor = None
+    if descriptor is not None and os.path.exists(descriptor):  # the descriptor is written last
+        return 0
+    os.makedirs(directory, exist_ok=True)
+
+    writer = TileWriter(directory, layout, extension, workers or os.cpu_count() or 1)
+    with contextlib.ExitStack() as stack:
+        img = process.open_img(stack, path)
+        box = (0, 0, img.width, img.height)
+        if tool == process.crop_img:
+            box = process.get_crop_box(img.width, img.height, params)
+        elif tool is not None:
+            img = process.apply_tool(img, tool, params)
+            stack.callback(img.close)
+            box = (0, 0, img.width, img.height)
+
+        width, height = box[2] - box[0], box[3] - box[1]
+        max_level = math.ceil(math.log2(max(width, height, 1)))
+        level = None
+        for i in range(max_level + 1):
+            level = PyramidLevel(i, tile_size, writer, level)
+
+        # bands of whole rows of tiles, which are halved for the smaller levels
+        mode = get_tile_mode(img.mode, extension)
+        try:
+            for top in range(box[1], box[3], tile_size):
+                band = tiling.read_region(img, (box[0], top, box[2], min(top + tile_size, box[3])))
+                level.add(band.convert(mode) if band.mode != mode else band)
+            level.finish()
+        finally:
+            writer.close()
+
+    if writer.errors:
+        raise writer.errors[0]
+    if descriptor is not None:
+        temp_path = stages.get_temp_path(descriptor)
+        with open(temp_path, "w", encoding="utf-8") as f:
+            f.write(dzi_template.format(tile_size, extension, width, height))
+        os.replace(temp_path, descriptor)
+
+    print("Wrote", writer.written, "tiles, kept", writer.skipped, "existing tiles.")
+    return writer.written
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Builds a zoomable tile pyramid of an image.")
+    parser.add_argument("input", help="image file")
+    parser.add_argument("output", help="destination folder")
+    parser.add_argument("params", nargs="*", metavar="name=value",
+                        help="crop the image first, named like in Params, e.g. width=1000 height=1000 pos=4")
+    parser.add_argument("--name", help="name of the pyramid, defaults to the name of the image")
+    parser.add_argument("--tile-size", type=int, default=pyramid_tile_size)
+    parser.add_argument("--format", choices=("jpg", "png", "webp"), default="jpg")
+    parser.add_argument("--layout", choices=pyramid_layouts, default="dzi")
+    parser.add_argument("--workers", type=int)
+    args = parser.parse_args(args)
+
+    tool, params = None, None
+    if args.params:
+        try:
+            params = process.get_params(dict(param.split("=", 1) for param in args.params))
+        except (TypeError, ValueError) as e:
+            parser.error("invalid tool parameters: {}".format(e))
+        tool = process.crop_img
+
+    build_pyramid(args.input, args.output, args.name, args.tile_size, args.format, args.layout, tool, params,
+                  args.workers)
+
+
+if __name__ == "__main__":
+    main()
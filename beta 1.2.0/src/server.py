@@ -0,0 +1,216 @@
+"""
+Copyright © 2021 Jonas Wombacher
+
+This file is part of Image Tools.
+
+Image Tools is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Image Tools is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Image Tools.  If not, see <https://www.gnu.org/licenses/>.
+"""
+import argparse
+import collections
+import concurrent.futures
+import hashlib
+import http.server
+import io
+import os
+import threading
+import urllib.parse
+
+from PIL import Image
+
+import src.process_imgs as process
+from src.values import *
+
+# url paths of the tools, in the order of the tool options
+tool_paths = ["crop", "resize_percentage", "resize_dimensions", "enhance", "greyscale", "flip", "rotate", "watermark"]
+
+# file extensions and content types of the formats the results can be encoded in
+output_formats = {"JPEG": ("jpg", "image/jpeg"), "PNG": ("png", "image/png")}
+
+
+# raised for url paths that name no tool, answered with 404
+class UnknownToolError(Exception):
+    pass
+
+
+# collects the encoded result of process_imgs.process_img instead of writing it to a file
+class ResultWriter:
+    def __init__(self):
+        self.data = None
+
+    def write(self, path, data):
+        self.data = data
+
+
+# processes the image in data with the tool and params given in the url path and query, e.g.
+# /resize_percentage?perc=50, the result is encoded in the format given by the format param or in the format of the
+# source, returns the result and its content type
+def process_request(path, data):
+    url = urllib.parse.urlsplit(path)
+    tool_path = url.path.strip("/")
+    if tool_path not in tool_paths:
+        raise UnknownToolError("unknown tool: {}".format(tool_path))
+    tool = process.get_tool_method(get_ui_text("tool_options", "EN")[tool_paths.index(tool_path)], "EN")
+
+    values = dict(urllib.parse.parse_qsl(url.query))
+    output_format = values.pop("format", None)
+    if "boxes" in values:  # the multi region crop has several results, but a response only has one
+        raise ValueError("boxes are not supported, crop every region in its own request")
+    params = process.get_params(values)
+
+    with Image.open(io.BytesIO(data)) as img:
+        probe = process.Probe("request", len(data), img)
+    output_format = output_format.upper() if output_format is not None else probe.format
+    output_format = "JPEG" if output_format == "JPG" else output_format
+    if output_format not in output_formats:
+        raise ValueError("unsupported output format: {}".format(output_format))
+    extension, content_type = output_formats[output_format]
+
+    writer = ResultWriter()
+    try:
+        route = process.get_route(probe, tool, params, False)  # results are kept in memory, so nothing is tiled
+        process.process_img(io.BytesIO(data), probe, params, tool, "result." + extension, route, writer)
+    except AttributeError as e:  # the tools read their params as attributes, which are only set when given
+        raise ValueError("missing tool parameter: {}".format(e.name)) from e
+    return writer.data, content_type
+
+
+# least recently used cache of responses, limited to max_bytes of response bodies, can be used by several threads
+class ResponseCache:
+    def __init__(self, max_bytes=server_cache_size * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    # returns the key of the response for the given request, the hash of the source and the sorted params
+    @staticmethod
+    def get_key(path, data):
+        url = urllib.parse.urlsplit(path)
+        query = sorted(urllib.parse.parse_qsl(url.query))
+        return hashlib.sha256(data).hexdigest(), url.path.strip("/"), tuple(query)
+
+    def get(self, key):
+        with self.lock:
+            if key not in self.entries:
+                return None
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+    def put(self, key, response):
+        if len(response[0]) > self.max_bytes:
+            return
+        with self.lock:
+            if key in self.entries:
+                return
+            self.entries[key] = response
+            self.size += len(response[0])
+            while self.size > self.max_bytes:
+                _, (data, _) = self.entries.popitem(last=False)
+                self.size -= len(data)
+
+
+# http server that processes the images posted to it with a bounded pool of workers, at most queue_size requests wait
+# for a worker, further requests are rejected with 503, connections are kept alive between requests
+class ImageServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, workers=None, queue_size=server_queue_size, cache_size=server_cache_size):
+        super().__init__(address, RequestHandler)
+        workers = workers or os.cpu_count() or 1
+        self.pool = concurrent.futures.ThreadPoolExecutor(workers)
+        self.capacity = workers + queue_size
+        self.pending = 0  # requests that are processed or wait for a worker
+        self.lock = threading.Lock()
+        self.cache = ResponseCache(cache_size * 1024 * 1024)
+
+    # processes the request in the pool, returns None if the pool is overloaded
+    def submit(self, path, data):
+        with self.lock:
+            if self.pending >= self.capacity:
+                return None
+            self.pending += 1
+
+        try:
+            return self.pool.submit(process_request, path, data).result()
+        finally:
+            with self.lock:
+                self.pending -= 1
+
+    def server_close(self):
+        super().server_close()
+        self.pool.shutdown()
+
+
+class RequestHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        if length > server_max_request_bytes:
+            self.send_error(413, "image too large")
+            return
+        data = self.rfile.read(length)
+
+        key = ResponseCache.get_key(self.path, data)
+        response = self.server.cache.get(key)
+        if response is None:
+            try:
+                response = self.server.submit(self.path, data)
+            except UnknownToolError as e:
+                self.send_error(404, str(e))
+                return
+            except (TypeError, ValueError, IndexError, OSError, SyntaxError) as e:  # invalid params, options or image
+                self.send_error(400, str(e))
+                return
+            except Exception as e:
+                self.send_error(500, str(e))
+                return
+
+            if response is None:
+                self.send_response(503)
+                self.send_header("Retry-After", "1")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.server.cache.put(key, response)
+
+        body, content_type = response
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Processes images posted to a local http server, e.g. "
+                                                 "curl --data-binary @in.jpg 'localhost:8080/crop?width=100&height=100"
+                                                 "&pos=4'")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--queue", type=int, default=server_queue_size, help="requests that may wait for a worker")
+    parser.add_argument("--cache", type=int, default=server_cache_size, help="size of the response cache in MB")
+    args = parser.parse_args(args)
+
+    with ImageServer((args.host, args.port), args.workers, args.queue, args.cache) as server:
+        print("serving on {}:{}".format(*server.server_address[:2]))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+"""
+Copyright © 2021 Jonas Wombacher
+
+This file is part of Image Tools.
+
+Image Tools is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Image Tools is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Image Tools.  If not, see <https://www.gnu.org/licenses/>.
+"""
+import os
+import queue
+import shutil
+import sys
+import threading
+import uuid
+
+from src.values import *
+
+
+# asks the kernel to start reading the file at path into the page cache, where posix_fadvise is available
+def advise_will_need(path):
+    if not hasattr(os, "posix_fadvise"):
+        return
+    try:
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+        finally:
+            os.close(fd)
+    except OSError:  # the worker reports the error when it opens the file
+        pass
+
+
+# returns the content of the file at path
+def read_file(path):
+    with open(path, "rb") as f:
+        if hasattr(os, "posix_fadvise"):
+            os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        return f.read()
+
+
+# reads the files of the given jobs ahead of their processing in a background thread, jobs is a list of tuples (job,
+# path, prefetch), the files of jobs with prefetch set to False are left to the workers, at most depth files are held
+# in memory, get can be called by several workers at once, read returns the content for a path (e.g. of an archive
+# member), only files read from disk are announced to the system before they are read
+class Prefetcher:
+    def __init__(self, jobs, depth=prefetch_depth, read=read_file):
+        self.queue = queue.Queue(depth)
+        self.read = read
+        self.thread = threading.Thread(target=self.run, args=(jobs, depth), daemon=True)
+        self.thread.start()
+
+    def run(self, jobs, depth):
+        try:
+            for i, (job, path, prefetch) in enumerate(jobs):
+                if i + depth < len(jobs) and self.read == read_file:  # let the disk already read the files queued next
+                    advise_will_need(jobs[i + depth][1])
+
+                data = None
+                if prefetch:
+                    try:
+                        data = self.read(path)
+                    except Exception:  # e.g. a corrupt archive member, the worker reports the error when it reads it
+                        pass
+                self.queue.put((job, data))
+        finally:
+            self.queue.put(None)  # the workers never wait for jobs that don't come
+
+    # returns the next job and the content of its file (or None if it wasn't prefetched), or None if all jobs were
+    # taken already
+    def get(self):
+        item = self.queue.get()
+        if item is None:
+            self.queue.put(None)  # for the other workers
+        return item
+
+
+# creates dst with the content of src without reading it where possible: as a hardlink (if hardlink is True, dst then
+# shares all later changes with src), as a reflink on file systems that support them (btrfs, xfs) or as a copy
+def clone_file(src, dst, hardlink=True):
+    if hardlink:
+        try:
+            os.link(src, dst)
+            return
+        except OSError:  # other file system or no hardlinks supported
+            pass
+
+    if sys.platform.startswith("linux"):
+        import fcntl
+        with open(src, "rb") as f_src, open(dst, "wb") as f_dst:
+            try:
+                fcntl.ioctl(f_dst.fileno(), 0x40049409, f_src.fileno())  # FICLONE
+                return
+            except OSError:
+                pass
+    shutil.copyfile(src, dst)
+
+
+# returns the path of a hidden temporary file next to path, under which the output for path is written before it is
+# renamed to path
+def get_temp_path(path):
+    directory, name = os.path.split(path)
+    return os.path.join(directory, ".{}.{}.tmp".format(name, uuid.uuid4().hex[:12]))
+
+
+# returns whether the file name is the name of a temporary file (see get_temp_path)
+def is_temp_name(name):
+    return name.startswith(".") and name.endswith(".tmp")
+
+
+# flushes the renames in the given directory to disk, which isn't possible (and not needed) on windows
+def sync_dir(directory):
+    if not hasattr(os, "O_DIRECTORY"):
+        return
+    fd = os.open(directory or ".", os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+# writes the encoded outputs in a background thread, so that the workers can go on with the next image while the
+# previous ones are written, at most depth outputs are held in memory,
+# outputs are written to a temporary file first and renamed to their final name once complete, so that nobody ever
+# sees partial files, durability decides when they are synced to disk:
+# "none" leaves it to the operating system,
+# "batch" syncs the outputs in batches of batch_size files and renames them after the sync,
+# "file" syncs every output before it is renamed
+class WriteBehind:
+    def __init__(self, depth=write_behind_depth, durability=default_durability, batch_size=sync_batch_size):
+        self.queue = queue.Queue(depth)
+        self.durability = durability
+        self.batch_size = batch_size if durability == "batch" else 1
+        self.batch = []  # tuples (file, temp path, path) of written but not yet synced and renamed outputs
+        self.failed = 0  # number of outputs that couldn't be written
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            if item == "flush":
+                self.commit()
+                continue
+
+            path, data, temp_path = item
+            f = None
+            try:
+                if data is not None:
+                    temp_path = get_temp_path(path)
+                    f = open(temp_path, "wb")
+                    f.write(data)
+                elif self.durability != "none":
+                    f = open(temp_path, "rb+")  # already written by a worker, but still needs to be synced
+            except OSError as e:
+                print("error writing image:", e)
+                self.failed += 1
+                self.discard(f, temp_path)
+                continue
+
+            self.batch.append((f, temp_path, path))
+            if len(self.batch) >= self.batch_size:
+                self.commit()
+
+        self.commit()
+
+    # syncs (depending on the durability) and renames all outputs of the current batch
+    def commit(self):
+        directories = set()
+        for f, temp_path, path in self.batch:
+            try:
+                if f is not None:
+                    if self.durability != "none":
+                        f.flush()
+                        os.fsync(f.fileno())
+                    f.close()
+                os.replace(temp_path, path)
+                directories.add(os.path.dirname(path))
+            except OSError as e:
+                print("error writing image:", e)
+                self.failed += 1
+                self.discard(f, temp_path)
+
+        if self.durability != "none":
+            for directory in directories:
+                try:
+                    sync_dir(directory)
+                except OSError as e:
+                    print("error syncing directory:", e)
+        self.batch = []
+
+    # closes and deletes a temporary file of an output that couldn't be written
+    def discard(self, f, temp_path):
+        try:
+            if f is not None:
+                f.close()
+            if temp_path is not None and os.path.exists(temp_path):
+                os.remove(temp_path)
+        except OSError:
+            pass
+
+    # writes the given content to path
+    def write(self, path, data):
+        self.queue.put((path, data, None))
+
+    # moves the complete file a worker wrote to temp_path (see get_temp_path) to path
+    def write_file(self, temp_path, path):
+        self.queue.put((path, None, temp_path))
+
+    # syncs and renames the outputs of the current batch without waiting for it to be full, for writers that are kept
+    # open between batches of work
+    def flush(self):
+        self.queue.put("flush")
+
+    # waits until all outputs are written
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
@@ -0,0 +1,368 @@
+"""
+Copyright © 2021 Jonas Wombacher
+
+This file is part of Image Tools.
+
+Image Tools is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Image Tools is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Image Tools.  If not, see <https://www.gnu.org/licenses/>.
+"""
+import io
+import mmap
+import os
+import struct
+import zlib
+
+from PIL import Image, ImageChops, TiffImagePlugin, TiffTags
+
+from src.values import *
+
+# bits per pixel of the uncompressed raw modes, that can be read row by row without decoding the whole image
+raw_mode_bits = {"1": 1, "L": 8, "LA": 16, "RGB": 24, "BGR": 24, "RGBA": 32, "BGRA": 32, "RGBX": 32, "BGRX": 32,
+                 "CMYK": 32}
+
+# raw modes pillow can use in place, without converting the pixels
+mapped_modes = ("L", "RGBX", "RGBA", "CMYK")
+
+# modes whose channels can be changed via lookup tables
+lut_modes = ("L", "LA", "RGB", "RGBA")
+
+# png color types of the modes the strip writer can write directly, all other modes are converted first
+png_color_types = {"L": 0, "RGB": 2, "LA": 4, "RGBA": 6}
+
+
+# tags of a tiff that are needed to decode one of its tiles or strips on its own
+tiff_block_tags = (258, 259, 262, 266, 277, 284, 317, 320, 338, 339, 347, 529, 530, 531, 532)
+
+
+# returns the uncompressed strips of img as tuples (top, bottom, offset, rawmode, stride, orientation), or None if img
+# is not stored in full width uncompressed strips (or was already loaded) and has to be decoded as a whole
+def get_raw_strips(img):
+    if not getattr(img, "tile", None) or img.fp is None or img.mode not in raw_mode_bits:
+        return None
+
+    strips = []
+    for tile in img.tile:
+        name, extents, offset, args = tile[:4]
+        if isinstance(args, str):
+            args = (args,)
+        if name != "raw" or args[0] not in raw_mode_bits or extents[0] != 0 or extents[2] != img.width:
+            return None
+
+        rawmode = args[0]
+        stride = args[1] if len(args) > 1 and args[1] else (img.width * raw_mode_bits[rawmode] + 7) // 8
+        orientation = args[2] if len(args) > 2 else 1
+        strips.append((extents[1], extents[3], offset, rawmode, stride, orientation))
+
+    return strips
+
+
+# returns the byte range and layout (start, end, stride, orientation) of the pixels of img, if they are stored
+# uncompressed, in the mode of img and in one contiguous block (which also holds for strips directly following each
+# other), so that pillow can use them in place, otherwise None
+def get_mapped_layout(img):
+    strips = get_raw_strips(img)
+    if not strips or img.mode not in mapped_modes:
+        return None
+
+    _, _, start, _, stride, orientation = strips[0]
+    if len(strips) > 1 and orientation < 0:
+        return None
+    end = start
+    row = 0
+    for strip_top, strip_bottom, offset, rawmode, strip_stride, strip_orientation in strips:
+        if (rawmode, strip_stride, strip_orientation) != (img.mode, stride, orientation):
+            return None
+        if (strip_top, offset) != (row, end):
+            return None
+        end += (strip_bottom - strip_top) * stride
+        row = strip_bottom
+
+    return (start, end, stride, orientation) if row == img.height else None
+
+
+# returns a read only image that uses the pixels of img directly from its memory mapped file, so they are neither read
+# nor copied into memory, but paged in by the system when a tool accesses them, returns None if the layout of img
+# doesn't allow it (see get_mapped_layout) or img was not opened from a file
+def map_img(img):
+    layout = get_mapped_layout(img)
+    if layout is None:
+        return None
+
+    start, end, stride, orientation = layout
+    try:
+        buffer = mmap.mmap(img.fp.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):  # file objects without a file descriptor
+        return None
+    if end > len(buffer):  # truncated file, which the decoder reports
+        return None
+
+    mapped = Image.frombuffer(img.mode, img.size, memoryview(buffer)[start:end], "raw", img.mode, stride, orientation)
+    mapped.info = dict(img.info)
+    return mapped
+
+
+# returns the compressed blocks of a tiff decoded by libtiff as (block width, block height, offsets, byte counts), the
+# blocks are its tiles or, if it isn't tiled, its strips, returns None for other images, images with separate planes or
+# with only a single block and images that were already loaded
+def get_tiff_blocks(img):
+    if img.format != "TIFF" or not getattr(img, "tile", None) or img.tile[0][0] != "libtiff" or img.fp is None:
+        return None
+
+    tags = img.tag_v2
+    if tags.get(284, 1) != 1 or tags.get(274, 1) != 1:  # separate planes, or rotated by pillow after decoding
+        return None
+    if 322 in tags:
+        width, height, offsets, counts = tags[322], tags.get(323), tags.get(324), tags.get(325)
+    else:
+        width, height, offsets, counts = img.width, min(tags.get(278, img.height), img.height), tags.get(273), \
+                                         tags.get(279)
+    offsets = (offsets,) if isinstance(offsets, int) else offsets
+    counts = (counts,) if isinstance(counts, int) else counts
+    columns = -(-img.width // width)
+    if not height or not offsets or not counts or len(offsets) != len(counts) or \
+            len(offsets) < columns * -(-img.height // height) or len(offsets) < 2:
+        return None
+    return width, height, offsets, counts
+
+
+# decodes the block of img with the given index (see get_tiff_blocks) on its own, as a tiff of the block's size with
+# the block as its only tile or strip, libtiff handles every compression as it would for the whole image
+def decode_tiff_block(img, blocks, index):
+    width, height, offsets, counts = blocks
+    tiled = 322 in img.tag_v2
+    if not tiled:  # the last strip may have fewer rows
+        height = min(height, img.height - index * height)
+
+    img.fp.seek(offsets[index])
+    data = img.fp.read(counts[index])
+
+    ifd = TiffImagePlugin.ImageFileDirectory_v2()
+    for tag in tiff_block_tags:
+        if tag in img.tag_v2:
+            ifd[tag] = img.tag_v2[tag]
+            ifd.tagtype[tag] = img.tag_v2.tagtype[tag]
+    ifd[256], ifd[257] = width, height
+    if tiled:
+        ifd[322], ifd[323] = width, height
+    else:
+        ifd[278] = height
+    offset_tag, count_tag = (324, 325) if tiled else (273, 279)
+    ifd[count_tag] = len(data)
+    ifd[offset_tag] = 0  # pillow moves strip offsets behind the directory, as it does when saving
+    ifd.tagtype[count_tag] = ifd.tagtype[offset_tag] = TiffTags.LONG
+    if tiled:
+        ifd[offset_tag] = 8 + len(ifd.tobytes(8))  # the data follows the header and the directory
+
+    block = Image.open(io.BytesIO(b"II*\0" + struct.pack("<I", 8) + ifd.tobytes(8) + data))
+    block.load()
+    return block
+
+
+# returns the box of a tiff with the given blocks (see get_tiff_blocks), only the blocks inside the box are decoded,
+# returns None if a block can't be decoded in the mode of img, so that img has to be decoded as a whole
+def read_tiff_region(img, box, blocks):
+    left, top, right, bottom = box
+    width, height = blocks[:2]
+    columns = -(-img.width // width)
+
+    region = Image.new(img.mode, (right - left, bottom - top))
+    for row in range(top // height, (bottom - 1) // height + 1):
+        for column in range(left // width, (right - 1) // width + 1):
+            block = decode_tiff_block(img, blocks, row * columns + column)
+            if block.mode != img.mode:
+                return None
+            region.paste(block, (column * width - left, row * height - top))
+    return region
+
+
+# returns the height of the rows of blocks img is decoded in by read_region, so that regions can be aligned to them
+def get_block_height(img):
+    blocks = get_tiff_blocks(img)
+    return blocks[1] if blocks is not None else 1
+
+
+# returns the box (left, top, right, bottom) of img, if img is stored in uncompressed strips, only the rows inside the
+# box are read from the file, if img is a tiff stored in compressed tiles or strips, only the blocks inside the box are
+# decoded, otherwise img is decoded once as a whole and the box is cut out of it
+def read_region(img, box):
+    strips = get_raw_strips(img)
+    if strips is None:
+        blocks = get_tiff_blocks(img)
+        region = read_tiff_region(img, box, blocks) if blocks is not None else None
+        return region if region is not None else img.crop(box)
+
+    left, top, right, bottom = box
+    parts = []
+    for strip_top, strip_bottom, offset, rawmode, stride, orientation in strips:
+        first, last = max(top, strip_top), min(bottom, strip_bottom)
+        if first >= last:
+            continue
+
+        if orientation < 0:  # rows are stored bottom up
+            img.fp.seek(offset + (strip_bottom - last) * stride)
+        else:
+            img.fp.seek(offset + (first - strip_top) * stride)
+        data = img.fp.read((last - first) * stride)
+        part = Image.frombytes(img.mode, (img.width, last - first), data, "raw", rawmode, stride, orientation)
+        if left != 0 or right != img.width:
+            part = part.crop((left, 0, right, part.height))
+        parts.append((first - top, part))
+
+    if len(parts) == 1:
+        return parts[0][1]
+
+    region = Image.new(img.mode, (right - left, bottom - top))
+    for y, part in parts:
+        region.paste(part, (0, y))
+    return region
+
+
+# yields the boxes of the horizontal strips the given box is split into, strips are as high as possible without
+# exceeding tiled_strip_bytes, but at least align rows high and, apart from the first one, start at multiples of align,
+# so that no row of blocks of the source (see get_block_height) is decoded twice
+def get_strips(box, align=1):
+    left, top, right, bottom = box
+    strip_height = max(1, tiled_strip_bytes // (4 * (right - left)))  # pillow stores up to 4 bytes per pixel
+    strip_height = max(align, strip_height // align * align)
+
+    strip_top = top
+    while strip_top < bottom:
+        strip_bottom = min(strip_top // align * align + strip_height, bottom)
+        yield left, strip_top, right, strip_bottom
+        strip_top = strip_bottom
+
+
+# returns the mean value of the given 8 bit histogram, rounded like ImageEnhance does for contrast changes
+def get_histogram_mean(histogram):
+    return int(sum(i * count for i, count in enumerate(histogram)) / sum(histogram) + 0.5)
+
+
+# returns the mean brightness of the given box of img, which is needed for contrast changes, computed strip by strip
+def get_mean(img, box):
+    histogram = [0] * 256
+    for strip_box in get_strips(box, get_block_height(img)):
+        for i, count in enumerate(read_region(img, strip_box).convert("L").histogram()):
+            histogram[i] += count
+
+    return get_histogram_mean(histogram)
+
+
+# returns x rounded to single precision, in which pillow computes blends
+def to_float32(x):
+    return struct.unpack("f", struct.pack("f", x))[0]
+
+
+# returns the lookup table of Image.blend from a solid image with the value degenerate to another image by factor,
+# which is what ImageEnhance does for contrast (from the mean) and brightness (from black), computed in single
+# precision and truncated like Image.blend, so that the results are identical
+def get_blend_lut(degenerate, factor):
+    alpha = to_float32(factor)
+    lut = []
+    for i in range(256):
+        val = to_float32(degenerate + to_float32(alpha * (i - degenerate)))
+        lut.append(0 if val <= 0 else 255 if val >= 255 else int(val))
+    return lut
+
+
+# applies the lookup table for one 8 bit channel to all color channels of img, the alpha channel stays unchanged
+def apply_color_lut(img, lut):
+    bands = len(img.getbands())
+    if "A" in img.mode:
+        return img.point(lut * (bands - 1) + list(range(256)))
+    return img.point(lut * bands)
+
+
+# reads the box of img strip by strip, passes every strip and its top coordinate (relative to the box) to strip_tool
+# and hands the results to the writer, so that only a single strip of the image is held in memory at once, if a strip
+# fails, the writer is aborted, so that no partial output is left behind
+def process_strips(img, box, strip_tool, writer):
+    try:
+        for strip_box in get_strips(box, get_block_height(img)):
+            strip = strip_tool(read_region(img, strip_box), strip_box[1] - box[1])
+            writer.write(strip)
+    except BaseException:
+        writer.abort()
+        raise
+    writer.close()
+
+
+# writes a png strip by strip, without ever holding the whole image in memory, the color profile and exif data in info
+# (the info of the source) are kept like when pillow writes the whole image
+class PngStripWriter:
+    def __init__(self, path, size, mode, info=None):
+        self.size = size
+        self.mode = mode if mode in png_color_types else ("RGBA" if "A" in mode else "RGB")
+        self.compressor = zlib.compressobj(6)
+        self.last_row = Image.new(self.mode, (size[0], 1))  # the row above the first row is zero for the filter
+        self.file = open(path, "wb")
+
+        self.file.write(b"\x89PNG\r\n\x1a\n")
+        self.write_chunk(b"IHDR", struct.pack(">IIBBBBB", size[0], size[1], 8, png_color_types[self.mode], 0, 0, 0))
+        info = info or {}
+        if info.get("icc_profile"):  # name, compression method and the compressed profile
+            self.write_chunk(b"iCCP", b"ICC Profile\0\0" + zlib.compress(info["icc_profile"]))
+        exif = info.get("exif")
+        if isinstance(exif, Image.Exif):
+            exif = exif.tobytes()
+        if exif:
+            self.write_chunk(b"eXIf", exif[6:] if exif.startswith(b"Exif\0\0") else exif)
+
+    def write_chunk(self, kind, data):
+        self.file.write(struct.pack(">I", len(data)) + kind + data)
+        self.file.write(struct.pack(">I", zlib.crc32(data, zlib.crc32(kind))))
+
+    # appends the rows of the given strip, rows are stored with the png "up" filter, i.e. as the difference to the row
+    # above, which is computed for the whole strip at once
+    def write(self, strip):
+        if strip.mode != self.mode:
+            strip = strip.convert(self.mode)
+        width, height = strip.size
+
+        above = Image.new(self.mode, strip.size)
+        above.paste(self.last_row, (0, 0))
+        above.paste(strip.crop((0, 0, width, height - 1)), (0, 1))
+        self.last_row = strip.crop((0, height - 1, width, height))
+
+        data = ImageChops.subtract_modulo(strip, above).tobytes()
+        row_bytes = len(data) // height
+        compressed = self.compressor.compress(b"".join(b"\x02" + data[i:i + row_bytes]
+                                                       for i in range(0, len(data), row_bytes)))
+        if compressed:
+            self.write_chunk(b"IDAT", compressed)
+
+    def close(self):
+        self.write_chunk(b"IDAT", self.compressor.flush())
+        self.write_chunk(b"IEND", b"")
+        self.file.close()
+
+    # closes and deletes the unfinished file
+    def abort(self):
+        self.file.close()
+        os.remove(self.file.name)
+
+
+# assembles the strips into one image, for formats that can't be written strip by strip
+class ImageStripWriter:
+    def __init__(self, size, mode):
+        self.image = Image.new(mode, size)
+        self.top = 0
+
+    def write(self, strip):
+        self.image.paste(strip, (0, self.top))
+        self.top += strip.height
+
+    def close(self):
+        pass
+
+    def abort(self):
+        self.image.close()
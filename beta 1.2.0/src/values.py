@@ -21,18 +21,26 @@ labels_EN = {"label_tool": "Select a tool:", "label_width": "Width (pixels):", "
              "label_pos": "Position:", "label_left": "Left (pixels):", "label_top": "Top (pixels):",
              "label_percentage": "Size > 0 (%):", "label_aspect": "Keep aspect ratio",
              "label_leq_geq_0": "Resulting dimensions", "label_leq_geq_1": "given dimensions",
+             "label_exact": "Exactly these dimensions (cropped or padded around the center)",
              "label_contrast": "Contrast >= 0:", "label_saturation": "Saturation >= 0:",
              "label_brightness": "Brightness >= 0:", "label_sharpness": "Sharpness >= 0:",
              "label_enhance_info": "1.0 means no change", "label_input": "Select the image source:",
              "label_output": "Select the destination folder:", "label_suffix": "Set suffix:",
-             "label_angle": "Angle (degrees):", "label_watermark": "Select watermark image:"}
+             "label_angle": "Angle (degrees):", "label_watermark": "Select watermark image:",
+             "label_resample": "Resampling:", "label_fillcolor": "Fill color (optional):",
+             "label_opacity": "Opacity 0-1 (optional):", "label_scale": "Width relative to the image 0-1 (optional):",
+             "label_pattern": "Repeat diagonally", "label_text": "Text instead of the image (optional):",
+             "label_font_size": "Font size in pixels:", "label_color": "Text color:",
+             "label_font": "Font file or name (optional):",
+             "label_boxes": "left,top,width,height;... (empty: name.json/name.csv next to each image)"}
 
 menu_EN = {"menu_settings": "Settings", "menu_lang": "Language", "menu_popups": "Pop-ups",
            "menu_popups_info": "Info after processing", "menu_help": "Help", "menu_about": "About",
            "menu_preview": "Preview", "menu_preview_disable": "Keep live preview disabled"}
 
 filedialog_EN = {"filedialog_folder": "Select a folder.", "filedialog_files": "Select one or multiple file(s).",
-                 "filedialog_file": "Select a file.", "filedialog_types": "Images"}
+                 "filedialog_file": "Select a file.", "filedialog_types": "Images",
+                 "filedialog_archives": "Archives"}
 
 errors_EN = {"error": "Error!", "error_io": "Image source and destination folder may not be empty!",
              "error_input": "The image source has to be a path to a folder or one or multiple images!",
@@ -41,7 +49,16 @@ errors_EN = {"error": "Error!", "error_io": "Image source and destination folder
              "error_params_zero": "Tool parameters have to be greater than (equal to) zero!",
              "error_suffix": "The suffix may not contain the following characters: \\ /:*?\"<>|",
              "error_filename": "The names of the source files may not contain commas!",
-             "error_watermark_file": "The watermark image has to be a valid file path!"}
+             "error_archive_output": "Several source files can't be written into one archive, select their folder "
+                                     "instead!",
+             "error_watermark_file": "The watermark image has to be a valid file path!",
+             "error_fillcolor": "The fill color has to be a color name or a hex code like #ffffff!",
+             "error_opacity": "The opacity has to be a decimal number between 0 and 1!",
+             "error_scale": "The relative width has to be a decimal number greater than 0 and at most 1!",
+             "error_font_size": "The font size has to be a whole number greater than 0!",
+             "error_color": "The text color has to be a color name or a hex code like #ffffff!",
+             "error_font": "The font has to be a TrueType or OpenType font file or the name of an installed font!",
+             "error_boxes": "Regions have to be given as left,top,width,height separated by semicolons!"}
 
 warnings_EN = {
     "warning_overwrite": "Warning: Using the same folder as source and destination with an empty suffix and the same file type will overwrite the original image!",
@@ -53,7 +70,9 @@ buttons_EN = {"button_enhance": "Set all to 1.0", "button_folder": "Open folder"
               "button_new_dest": "Save as new default destination", "button_new_suffix": "Save as new default suffix",
               "button_preview": "Preview", "button_live": "Live", "button_process": "Process images",
               "radio_flip_v": "flip vertically", "radio_flip_h": "flip horizontally",
-              "radio_position_pre": "Predefined position", "radio_position_var": "Variable position"}
+              "radio_position_pre": "Predefined position", "radio_position_var": "Variable position",
+              "radio_regions": "Several regions",
+              "radio_nearest": "Nearest", "radio_bilinear": "Bilinear", "radio_bicubic": "Bicubic"}
 
 selection_EN = {"tool_options": ["Crop images", "Resize by percentage",
                                  "Resize to specific dimensions",
@@ -67,7 +86,7 @@ help_EN = {"help_tools": {
     "Tool: Enhance images, e.g. per contrast": "This tool changes the image's contrast, saturation, brightness and sharpness by the given factors.\nA factor of 1.0 means the image's according attribute is not altered.",
     "Tool: Convert to greyscale": "This tool converts the image into a greyscale image.",
     "Tool: Flip images": "This tool flips the image either vertically or horizontally.",
-    "Tool: Rotate images (counterclockwise)": "This tool rotates the image by the given angle. Positive values result in counterclockwise rotation and negative values in clockwise rotation.",
+    "Tool: Rotate images (counterclockwise)": "This tool rotates the image by the given angle. Positive values result in counterclockwise rotation and negative values in clockwise rotation.\nMultiples of 90 degrees are rotated losslessly. For other angles, the resampling filter determines the quality (\"Nearest\" is fastest, \"Bicubic\" smoothest) and the fill color is used for the corners outside of the original image.",
     "Tool: Apply watermark": "This tool pastes one image as a watermark onto other images."}}
 
 about_EN = {
@@ -85,18 +104,25 @@ labels_DE = {"label_tool": "Werkzeug auswählen:", "label_width": "Breite (Pixel
              "label_pos": "Position:", "label_left": "Links (Pixel):", "label_top": "Oben (Pixel):",
              "label_percentage": "Größe > 0 (%):", "label_aspect": "Seitenverhältnis beibehalten",
              "label_leq_geq_0": "Ergebnis-Dimensionen", "label_leq_geq_1": "angegebene Dimensionen",
+             "label_exact": "Genau diese Dimensionen (um die Mitte zugeschnitten oder aufgefüllt)",
              "label_contrast": "Kontrast >= 0:", "label_saturation": "Sättigung >= 0:",
              "label_brightness": "Helligkeit >= 0:", "label_sharpness": "Schärfe >= 0:",
              "label_enhance_info": "1.0 heißt keine Änderung", "label_input": "Bild-Quelle auswählen:",
              "label_output": "Ziel-Ordner auswählen", "label_suffix": "Suffix wählen:", "label_angle": "Winkel (Grad):",
-             "label_watermark": "Wasserzeichen-Bild auswählen:"}
+             "label_watermark": "Wasserzeichen-Bild auswählen:", "label_resample": "Interpolation:",
+             "label_fillcolor": "Füllfarbe (optional):", "label_opacity": "Deckkraft 0-1 (optional):",
+             "label_scale": "Breite relativ zum Bild 0-1 (optional):", "label_pattern": "Diagonal wiederholen",
+             "label_text": "Text statt des Bildes (optional):", "label_font_size": "Schriftgröße in Pixeln:",
+             "label_color": "Textfarbe:", "label_font": "Schriftdatei oder -name (optional):",
+             "label_boxes": "links,oben,Breite,Höhe;... (leer: name.json/name.csv neben jedem Bild)"}
 
 menu_DE = {"menu_settings": "Einstellungen", "menu_lang": "Sprache", "menu_popups": "Pop-ups",
            "menu_popups_info": "Info nach Bearbeitung", "menu_help": "Hilfe", "menu_about": "Über",
            "menu_preview": "Vorschau", "menu_preview_disable": "Live-Vorschau dauerhaft deaktivieren"}
 
 filedialog_DE = {"filedialog_folder": "Ordner auswählen.", "filedialog_files": "Eine oder mehrere Datei(en) auswählen.",
-                 "filedialog_file": "Datei auswählen.", "filedialog_types": "Bilder"}
+                 "filedialog_file": "Datei auswählen.", "filedialog_types": "Bilder",
+                 "filedialog_archives": "Archive"}
 
 errors_DE = {"error": "Fehler!", "error_io": "Die Bild-Quelle und der Ziel-Ordner dürfen nicht leer sein!",
              "error_input": "Die Bild-Quelle muss ein Pfad zu einem Ordner oder einem oder mehreren Bildern sein!",
@@ -105,7 +131,17 @@ errors_DE = {"error": "Fehler!", "error_io": "Die Bild-Quelle und der Ziel-Ordne
              "error_params_zero": "Parameter müssen größer (gleich) Null sein!",
              "error_suffix": "Das Suffix darf folgende Zeichen nicht enthalten: \\ /:*?\"<>|",
              "error_filename": "Die Namen der Quell-Dateien dürfen keine Kommata enthalten!",
-             "error_watermark_file": "Das Wasserzeichen-Bild muss ein gültiger Dateipfad sein!"}
+             "error_archive_output": "Mehrere Quell-Dateien können nicht in ein Archiv geschrieben werden, stattdessen "
+                                     "ihren Ordner auswählen!",
+             "error_watermark_file": "Das Wasserzeichen-Bild muss ein gültiger Dateipfad sein!",
+             "error_fillcolor": "Die Füllfarbe muss ein Farbname oder ein Hex-Code wie #ffffff sein!",
+             "error_opacity": "Die Deckkraft muss eine Dezimalzahl zwischen 0 und 1 sein!",
+             "error_scale": "Die relative Breite muss eine Dezimalzahl größer als 0 und höchstens 1 sein!",
+             "error_font_size": "Die Schriftgröße muss eine ganze Zahl größer als 0 sein!",
+             "error_color": "Die Textfarbe muss ein Farbname oder ein Hex-Code wie #ffffff sein!",
+             "error_font": "Die Schrift muss eine TrueType- oder OpenType-Datei oder der Name einer installierten "
+                           "Schrift sein!",
+             "error_boxes": "Bereiche müssen als links,oben,Breite,Höhe getrennt durch Semikolons angegeben werden!"}
 
 warnings_DE = {
     "warning_overwrite": "Warnung: Bei Benutzen des selben Ordners als Quelle und Ziel mit einem leeren Suffix und gleichem Dateityp wird das originale Bild überschrieben!",
@@ -118,7 +154,9 @@ buttons_DE = {"button_enhance": "Alle auf 1.0 setzen", "button_folder": "Ordner
               "button_new_suffix": "Als neues Standard-Suffix speichern", "button_preview": "Vorschau",
               "button_live": "Live", "button_process": "Bilder bearbeiten", "radio_flip_v": "Vertikal spiegeln",
               "radio_flip_h": "Horizontal spiegeln", "radio_position_pre": "Vordefinierte Position",
-              "radio_position_var": "Variable Position"}
+              "radio_position_var": "Variable Position", "radio_regions": "Mehrere Bereiche",
+              "radio_nearest": "Nächster Nachbar",
+              "radio_bilinear": "Bilinear", "radio_bicubic": "Bikubisch"}
 
 selection_DE = {"tool_options": ["Bilder zuschneiden",
                                  "Größe nach Prozentwert ändern",
@@ -134,7 +172,7 @@ help_DE = {"help_tools": {
     "Werkzeug: Bilder verbessern, z.B. per Kontrast": "Dieses Werkzeug verändert Kontrast, Sättigung, Helligkeit und Schärfe des Bildes um die gegebenen Faktoren.\nEin Faktor von 1.0 bedeutet, dass das entsprechende Attribut des Bildes nicht verändert wird.",
     "Werkzeug: Zu Graustufen konvertieren": "Dieses Werkzeug konvertiert das Bild zu einem Graustufenbild.",
     "Werkzeug: Bilder spiegeln": "Dieses Werkzeug spiegelt das Bild entweder an seiner vertikalen oder horizontalen Achse.",
-    "Werkzeug: Bilder drehen (gegen den Uhrzeigersinn)": "Dieses Werkzeug dreht das Bild um den gegebenen Winkel. Positive Werte ergeben eine Rotation gegen den Uhrzeigersinn und negative Werte eine Rotation im Uhrzeigersinn.",
+    "Werkzeug: Bilder drehen (gegen den Uhrzeigersinn)": "Dieses Werkzeug dreht das Bild um den gegebenen Winkel. Positive Werte ergeben eine Rotation gegen den Uhrzeigersinn und negative Werte eine Rotation im Uhrzeigersinn.\nVielfache von 90 Grad werden verlustfrei gedreht. Bei anderen Winkeln bestimmt die Interpolation die Qualität (\"Nächster Nachbar\" ist am schnellsten, \"Bikubisch\" am glattesten) und die Füllfarbe wird für die Ecken außerhalb des ursprünglichen Bildes verwendet.",
     "Werkzeug: Wasserzeichen einfügen": "Dieses Werkzeug kopiert ein Bild als Wasserzeichen auf andere Bilder."}}
 
 about_DE = {
@@ -171,6 +209,72 @@ live_preview_clock = 500
 tool_menu_width = 60
 scrollbar_width = 17
 
+# thumbnail cache for the preview
+thumbnail_cache_size = 256  # default size cap in MB
+thumbnail_cache_step = 256  # thumbnail resolutions are rounded up to multiples of this, so resizing reuses entries
+
+# tiled processing of very large images
+tiled_threshold = 512 * 1024 * 1024  # decoded size in bytes, above which images are processed strip by strip
+tiled_strip_bytes = 16 * 1024 * 1024  # maximum size of a single strip in bytes
+
+# estimated memory in bytes, that all images processed at the same time may use
+memory_budget = 2 * 1024 * 1024 * 1024
+
+# overlapped reading and writing
+prefetch_depth = 8  # number of files read ahead of the processing
+prefetch_max_bytes = 256 * 1024 * 1024  # larger files are read by the workers themselves
+write_behind_depth = 16  # number of encoded outputs waiting to be written
+
+# images that the tool wouldn't change are copied instead of encoded again, with noop_hardlink they are hardlinked,
+# which is faster, but every later change of the output also changes the source
+noop_hardlink = False
+
+# content addressed cache of outputs
+result_cache_size = 0  # default size cap in MB, 0 disables the cache
+result_cache_version = 1  # part of every key, has to be increased when the tools or the encoder settings change
+# with result_cache_hardlink, hits are hardlinked to the cache entry instead of reflinked or copied, which is faster,
+# but every later change of the output also changes the cached result
+result_cache_hardlink = False
+
+# prepared watermark layers, which are shared by all images of a batch
+watermark_cache_size = 256  # size cap in MB
+watermark_pattern_angle = 30  # rotation of the repeated watermarks in degrees
+watermark_pattern_spacing = 0.5  # gap between the repeated watermarks, relative to their size
+watermark_font_size = 32  # in pixels
+watermark_color = "white"
+
+# resizing to exact dimensions (fit and fill), the image is first reduced by an integer factor to at most this many
+# times the target size, which is faster than resampling it as a whole and looks the same
+resize_reducing_gap = 3.0
+
+# multi region crop
+region_suffix = "_{}"  # appended to the suffix of every region, with the region's number starting at 1
+region_file_extensions = ("json", "csv")  # files next to an image, with the same name, that list its regions
+
+# zoomable tile pyramids
+pyramid_tile_size = 256
+pyramid_layouts = ("dzi", "xyz")
+
+# durability of the outputs: "none" (synced by the operating system), "batch" (synced in batches of sync_batch_size
+# files) or "file" (every file is synced on its own), outputs are always renamed to their final name once complete
+durability_modes = ("none", "batch", "file")
+default_durability = "none"
+sync_batch_size = 64
+
+# hot folder watching
+watch_poll_interval = 0.25  # seconds between two scans of the folder, if inotify isn't available
+watch_timeout = 0.5  # seconds after which the watcher checks whether it was stopped
+
+# http server
+server_queue_size = 32  # requests that may wait for a worker, further requests are rejected
+server_cache_size = 64  # size of the response cache in MB
+server_max_request_bytes = 256 * 1024 * 1024
+
+# supported output file types
+supported_extensions = ("jpg", "jpeg", "png", "tif", "tiff", "bmp", "ppm", "pgm")
+# archives the images can be read from (see archives.open_archive, which also recognizes them by their content)
+archive_extensions = ("zip", "tar", "tar.gz", "tgz", "tar.bz2", "tar.xz")
+
 # colors
 color_bg = "#ABB2B9"  # grey
 color_button_text = "#CCD1D1"  # light grey
@@ -0,0 +1,241 @@
+"""
+Copyright © 2021 Jonas Wombacher
+
+This file is part of Image Tools.
+
+Image Tools is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Image Tools is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Image Tools.  If not, see <https://www.gnu.org/licenses/>.
+"""
+import argparse
+import concurrent.futures
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import threading
+import time
+
+import src.process_imgs as process
+import src.stages as stages
+from src.values import *
+
+# inotify events of files that were closed after writing or moved into the watched folder, i.e. are complete
+inotify_events = 0x00000008 | 0x00000080  # IN_CLOSE_WRITE | IN_MOVED_TO
+inotify_event_header = struct.Struct("iIII")  # wd, mask, cookie, len, followed by the name
+
+
+# returns whether the file with the given name should be processed, hidden files (like the temporary outputs) are
+# ignored
+def is_watched(file):
+    extension = file.rsplit(".", 1)[1] if "." in file else ""
+    return not file.startswith(".") and extension.lower() in supported_extensions
+
+
+# reports the files in a folder that were completely written, using inotify on linux
+class InotifyWatcher:
+    def __init__(self, directory):
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        if self.libc.inotify_add_watch(self.fd, os.fsencode(directory), inotify_events) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, "inotify_add_watch failed", directory)
+
+    # waits at most timeout seconds for new files and returns their names
+    def get(self, timeout):
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return []
+
+        data = os.read(self.fd, 64 * 1024)
+        files = []
+        offset = 0
+        while offset < len(data):
+            _, mask, _, length = inotify_event_header.unpack_from(data, offset)
+            offset += inotify_event_header.size
+            name = data[offset:offset + length].rstrip(b"\0")
+            offset += length
+            if mask & inotify_events and name:
+                files.append(os.fsdecode(name))
+        return files
+
+    def close(self):
+        os.close(self.fd)
+
+
+# reports the files in a folder that were completely written, by scanning the folder every interval seconds, a file
+# counts as complete once its size and modification time didn't change between two scans
+class PollingWatcher:
+    def __init__(self, directory, interval=watch_poll_interval):
+        self.directory = directory
+        self.interval = interval
+        self.seen = self.scan()  # files present at the start are not reported
+        self.pending = {}  # changed files that weren't stable yet
+        self.last_scan = time.monotonic()
+
+    # returns a dict of the names and (size, modification time) of all files in the folder
+    def scan(self):
+        files = {}
+        for entry in os.scandir(self.directory):
+            try:
+                if entry.is_file():
+                    stat = entry.stat()
+                    files[entry.name] = (stat.st_size, stat.st_mtime_ns)
+            except OSError:  # removed in the meantime
+                pass
+        return files
+
+    # waits at most timeout seconds for new files and returns their names
+    def get(self, timeout):
+        time.sleep(max(0.0, min(timeout, self.last_scan + self.interval - time.monotonic())))
+        if time.monotonic() < self.last_scan + self.interval:
+            return []
+        self.last_scan = time.monotonic()
+
+        files = []
+        current = self.scan()
+        for name, state in current.items():
+            if self.seen.get(name) == state:
+                continue
+            if self.pending.get(name) == state:  # unchanged since the last scan
+                files.append(name)
+                self.seen[name] = state
+                del self.pending[name]
+            else:
+                self.pending[name] = state
+
+        for name in set(self.seen) - set(current):
+            del self.seen[name]
+        return files
+
+    def close(self):
+        pass
+
+
+# returns an inotify watcher where inotify is available and a polling watcher otherwise
+def create_watcher(directory, polling=False):
+    if not polling and sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher(directory)
+        except (OSError, AttributeError) as e:  # no inotify in this libc or out of watches
+            print("inotify not available, polling instead:", e)
+    return PollingWatcher(directory)
+
+
+# watches in_dir and processes every image that is written into it with the given tool (see get_tool_method) and
+# params into out_dir, the workers and the writer are started once and kept running, so that an image is processed
+# as soon as it is complete
+class HotFolder:
+    def __init__(self, in_dir, out_dir, params, tool, lang, suffix, workers=None, durability=default_durability,
+                 polling=False):
+        if os.path.abspath(in_dir) == os.path.abspath(out_dir):
+            raise ValueError("the watched folder can't be the destination folder")
+        os.makedirs(out_dir, exist_ok=True)
+
+        self.in_dir = in_dir
+        self.out_dir = out_dir
+        self.params = params
+        self.tool = process.get_tool_method(tool, lang)
+        self.suffix = suffix
+        self.watcher = create_watcher(in_dir, polling)
+        self.pool = concurrent.futures.ThreadPoolExecutor(workers or os.cpu_count() or 1)
+        self.writer = stages.WriteBehind(durability=durability)
+        self.budget = process.MemoryBudget(memory_budget)
+        self.lock = threading.Lock()
+        self.running = 0  # images that are currently processed
+        self.stopped = threading.Event()
+
+    # processes a single file of the watched folder
+    def process(self, file):
+        try:
+            probe = process.probe_img(self.in_dir, file)
+            if probe is None:
+                return
+
+            name, extension = file.rsplit(".", 1)
+            out_path = os.path.join(self.out_dir, name + self.suffix + "." + extension)
+            route = process.get_route(probe, self.tool, self.params, None)
+            memory = process.get_memory_estimate(probe, self.tool, self.params, route)
+            self.budget.acquire(memory)
+            try:
+                process.process_img(os.path.join(self.in_dir, file), probe, self.params, self.tool, out_path, route,
+                                    self.writer)
+                print("processed", file)
+            finally:
+                self.budget.release(memory)
+        except Exception as e:
+            print("error processing image:", e)
+        finally:
+            with self.lock:
+                self.running -= 1
+                if self.running == 0:  # nothing left to batch with, so don't let the outputs wait
+                    self.writer.flush()
+
+    def submit(self, file):
+        with self.lock:
+            self.running += 1
+        self.pool.submit(self.process, file)
+
+    # processes new files until stop is called, files that are already in the folder are processed first if existing
+    # is True
+    def run(self, existing=False):
+        if existing:
+            for file in process.get_filenames(self.in_dir):
+                if is_watched(file):
+                    self.submit(file)
+
+        try:
+            while not self.stopped.is_set():
+                for file in self.watcher.get(watch_timeout):
+                    if is_watched(file):
+                        self.submit(file)
+        finally:
+            self.pool.shutdown()
+            self.writer.close()
+            self.watcher.close()
+
+    def stop(self):
+        self.stopped.set()
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Processes every image written into a folder.")
+    parser.add_argument("input", help="folder to watch")
+    parser.add_argument("output", help="destination folder")
+    parser.add_argument("tool", choices=get_ui_text("tool_options", "EN"), help="tool to apply")
+    parser.add_argument("params", nargs="*", metavar="name=value", help="tool parameters, named like in Params")
+    parser.add_argument("--suffix", default=get_ui_text("default_suffix", "EN"))
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--durability", choices=durability_modes, default=default_durability)
+    parser.add_argument("--existing", action="store_true", help="process the images already in the folder first")
+    parser.add_argument("--polling", action="store_true", help="scan the folder instead of using inotify")
+    args = parser.parse_args(args)
+
+    try:
+        params = process.get_params(dict(param.split("=", 1) for param in args.params))
+    except (TypeError, ValueError) as e:
+        parser.error("invalid tool parameters: {}".format(e))
+
+    hot_folder = HotFolder(args.input, args.output, params, args.tool, "EN", args.suffix, args.workers,
+                           args.durability, args.polling)
+    try:
+        hot_folder.run(args.existing)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+"""
+Copyright © 2021 Jonas Wombacher
+
+This file is part of Image Tools.
+
+Image Tools is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Image Tools is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Image Tools.  If not, see <https://www.gnu.org/licenses/>.
+"""
+import collections
+import functools
+import math
+import os
+import threading
+
+from PIL import Image, ImageChops, ImageColor, ImageDraw, ImageFont
+
+from src.values import *
+
+# modes of images the watermark can be composited onto directly, all other modes are converted first
+composite_modes = ("RGB", "RGBA", "L", "LA", "CMYK")
+
+
+# least recently used cache of prepared watermark layers, limited to max_bytes of pixel data, layers larger than that
+# aren't cached at all, can be used by several threads, so that all images of a batch share the layers
+class LayerCache:
+    def __init__(self, max_bytes=watermark_cache_size * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    # returns the layer for key, create is only called on a cache miss
+    def get(self, key, create):
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                return self.entries[key]
+
+        layer = create()  # outside of the lock, so that other workers can use the cache in the meantime
+        if layer.width * layer.height * 4 > self.max_bytes:
+            return layer
+        with self.lock:
+            if key not in self.entries:
+                self.entries[key] = layer
+                self.size += layer.width * layer.height * 4
+            while self.size > self.max_bytes:
+                _, old = self.entries.popitem(last=False)
+                self.size -= old.width * old.height * 4
+            return self.entries[key]
+
+
+layer_cache = LayerCache()
+
+
+# returns img as rgba with the given opacity (0 to 1) applied to its alpha channel
+def prepare_layer(img, opacity=1.0):
+    layer = img.convert("RGBA")  # also resolves the transparency of palette images
+    if opacity < 1.0:
+        layer.putalpha(layer.getchannel("A").point(lambda a: round(a * opacity)))
+    return layer
+
+
+# returns the layer resampled to the given width, the height keeps the aspect ratio, the colors are resampled
+# premultiplied with their alpha, so that the invisible colors of transparent pixels don't bleed into the edges
+def scale_layer(layer, width):
+    height = max(1, round(layer.height * width / layer.width))
+    return layer.convert("RGBa").resize((width, height), Image.LANCZOS).convert("RGBA")
+
+
+# returns the font file (or name of an installed font, None for the default font) in the given size in pixels, the
+# fonts are shared by all threads, so they are only used under font_lock
+@functools.lru_cache(maxsize=16)
+def get_font(font, size):
+    if font is None:
+        return ImageFont.load_default(size)
+    return ImageFont.truetype(font, size)
+
+
+font_lock = threading.RLock()
+
+
+# returns the free space around rendered text, so that glyphs reaching beyond their advance or the ascent aren't cut
+def get_text_padding(size):
+    return size // 4 + 1
+
+
+# returns the mask of a single word of text, with a line's height and the padding on all sides, the baseline at the
+# same height for all words, so that the masks can be put together to lines
+def load_word(word, font, size):
+    def create():
+        with font_lock:
+            fnt = get_font(font, size)
+            ascent, descent = fnt.getmetrics()
+            pad = get_text_padding(size)
+            right = max(fnt.getlength(word), fnt.getbbox(word, anchor="ls")[2])
+            mask = Image.new("L", (math.ceil(right) + 2 * pad, ascent + descent + 2 * pad))
+            ImageDraw.Draw(mask).text((pad, pad + ascent), word, fill=255, font=fnt, anchor="ls")
+            return mask
+
+    return layer_cache.get(("word", word, font, size), create)
+
+
+# returns the text as layer in the given color (a color name or hex code, its alpha is combined with opacity), the
+# layer is cut to the rendered glyphs, so that get_position places them at the edges, the text is put together from
+# the cached masks of its words, so text that only differs in a few words (e.g. a file name or an order number) only
+# renders those words again
+def render_text(text, font, size, color, opacity=1.0):
+    with font_lock:
+        fnt = get_font(font, size)
+        ascent, descent = fnt.getmetrics()
+        space = fnt.getlength(" ")
+        words = []  # left, top and mask of every word
+        width = 0
+        for row, line in enumerate(text.split("\n")):
+            left = 0.0
+            for word in line.split(" "):
+                if word:
+                    words.append((round(left), row * (ascent + descent), load_word(word, font, size)))
+                left += fnt.getlength(word) + space
+            width = max(width, left - space)
+
+    pad = get_text_padding(size)
+    mask = Image.new("L", (math.ceil(width) + 2 * pad, len(text.split("\n")) * (ascent + descent) + 2 * pad))
+    for left, top, word in words:
+        box = (left, top, left + word.width, top + word.height)
+        mask.paste(ImageChops.lighter(mask.crop(box), word), box)  # the padding of a word may cover its neighbours
+
+    color = ImageColor.getrgb(color)
+    alpha = opacity * (color[3] / 255 if len(color) == 4 else 1.0)
+    layer = Image.new("RGBA", mask.size, color[:3] + (0,))
+    layer.putalpha(mask.point(lambda a: round(a * alpha)) if alpha < 1.0 else mask)
+    bbox = mask.getbbox()
+    return layer.crop(bbox) if bbox is not None else layer.crop((0, 0, 1, 1))
+
+
+# returns the key of the watermark image at path with the given opacity (0 to 1), which also changes when the file is
+# modified
+def get_image_key(path, opacity=1.0):
+    stat = os.stat(path)
+    return "image", os.path.abspath(path), stat.st_mtime_ns, stat.st_size, opacity
+
+
+# returns the key of a text watermark, see render_text for the parameters
+def get_text_key(text, font=None, size=watermark_font_size, color=watermark_color, opacity=1.0):
+    return "text", text, font, size, color, opacity
+
+
+def create_layer(key):
+    if key[0] == "text":
+        return render_text(*key[1:])
+    with Image.open(key[1]) as img:
+        return prepare_layer(img, key[4])
+
+
+# returns the watermark with the given key (see get_image_key and get_text_key) prepared as layer, optionally scaled to
+# width, every layer is only loaded, prepared and scaled once for every key and width, so a batch with a few distinct
+# image sizes only scales the watermark a few times, text is rendered again in the font size that gives about that
+# width instead of being scaled, so that it stays sharp
+def load_layer(key, width=None):
+    if width is None:
+        return layer_cache.get(key, lambda: create_layer(key))
+
+    if key[0] == "text":
+        _, text, font, size, color, opacity = key
+        size = max(1, round(size * width / load_layer(key).width))
+        return load_layer(get_text_key(text, font, size, color, opacity))
+    return layer_cache.get(key + (width,), lambda: scale_layer(load_layer(key), width))
+
+
+# returns the layer rotated counterclockwise by angle degrees, with transparent corners, the colors are resampled
+# premultiplied like in scale_layer
+def rotate_layer(layer, angle):
+    return layer.convert("RGBa").rotate(angle, Image.BICUBIC, expand=True).convert("RGBA")
+
+
+# composites the stamp repeated in rows onto img, every other row shifted by half a step, so that the stamps line up
+# diagonally, spacing is the gap between two stamps relative to the size of the stamp, img may be a strip of the
+# covered image starting at row top, only the stamps reaching into it are composited, so large images can be covered
+# strip by strip without a layer of their whole size, returns img or a converted copy (see composite)
+def composite_pattern(img, stamp, spacing, top=0):
+    step_x = max(1, round(stamp.width * (1 + spacing)))
+    step_y = max(1, round(stamp.height * (1 + spacing)))
+
+    first = max(0, (top - stamp.height) // step_y + 1)  # first row of stamps whose bottom is below top
+    for row in range(first, (top + img.height + step_y - 1) // step_y):
+        shift = step_x // 2 if row % 2 else 0
+        for left in range(shift - step_x, img.width, step_x):
+            img = composite(img, stamp, left, row * step_y - top)
+    return img
+
+
+# returns a layer of the given size covered with the stamp (see composite_pattern)
+def render_pattern(stamp, size, spacing):
+    return composite_pattern(Image.new("RGBA", size, (0, 0, 0, 0)), stamp, spacing)
+
+
+# returns the watermark with key (see load_layer for key and width) rotated by angle, the stamp a pattern repeats
+def load_stamp(key, width=None, angle=watermark_pattern_angle):
+    if angle % 360 == 0:
+        return load_layer(key, width)
+    return layer_cache.get(("stamp", key, width, angle), lambda: rotate_layer(load_layer(key, width), angle))
+
+
+# returns a layer of the given size covered with the watermark with key (see load_stamp) repeated with spacing (see
+# composite_pattern), every pattern is only rendered once, so images of the same size share it
+def load_pattern(key, size, width=None, angle=watermark_pattern_angle, spacing=watermark_pattern_spacing):
+    return layer_cache.get(("pattern", key, width, size, angle, spacing),
+                           lambda: render_pattern(load_stamp(key, width, angle), size, spacing))
+
+
+# returns the mode of the result of compositing onto img, images in other modes than composite_modes are converted,
+# keeping their transparency
+def get_composite_mode(img):
+    if img.mode in composite_modes:
+        return img.mode
+    return "RGBA" if "transparency" in img.info or "A" in img.mode else "RGB"
+
+
+# composites the layer onto img with its upper left corner at (left, top), which may be outside of img, only the part
+# of img covered by the layer is changed, so the cost depends on the size of the layer, not of img, returns img or a
+# converted copy for modes the layer can't be composited onto
+def composite(img, layer, left, top):
+    if img.mode not in composite_modes:
+        img = img.convert(get_composite_mode(img))
+
+    box = (max(left, 0), max(top, 0), min(left + layer.width, img.width), min(top + layer.height, img.height))
+    if box[0] >= box[2] or box[1] >= box[3]:  # completely outside of img
+        return img
+
+    source = (box[0] - left, box[1] - top, box[2] - left, box[3] - top)
+    if "A" in img.mode:
+        if img.mode == "RGBA":
+            img.alpha_composite(layer, box[:2], source)
+        else:
+            region = img.crop(box).convert("RGBA")
+            region.alpha_composite(layer, (0, 0), source)
+            img.paste(region.convert(img.mode), box[:2])
+        return img
+
+    # on opaque images, compositing is the same as pasting with the alpha channel as mask, which needs no conversion
+    # of the image
+    part = layer if source == (0, 0, layer.width, layer.height) else layer.crop(source)
+    img.paste(part, box[:2], part)
+    return img
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# the tests import the app like it imports itself, as the package src
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,16 @@
+import os
+
+import src.cache as cache
+import src.stages as stages
+
+
+# the temporary files of writers that haven't finished yet are never evicted, even if they are the oldest files
+def test_evict_lru_skips_temp_files(tmp_path):
+    temp_path = stages.get_temp_path(str(tmp_path / "a.png"))
+    for i, path in enumerate([temp_path, str(tmp_path / "b.png"), str(tmp_path / "c.png")]):
+        with open(path, "wb") as f:
+            f.write(b"x" * 100)
+        os.utime(path, (i, i))
+
+    assert cache.evict_lru(str(tmp_path), 100) == 100
+    assert sorted(os.listdir(tmp_path)) == sorted([os.path.basename(temp_path), "c.png"])
@@ -0,0 +1,33 @@
+import itertools
+
+import pytest
+from PIL import Image, ImageEnhance
+
+import src.process_imgs as process
+
+factors = [0.0, 0.3, 0.7, 1.0, 1.3, 2.0, 3.3]
+
+
+def get_img(mode):
+    img = Image.merge("RGB", [Image.effect_noise((300, 200), 90).convert("L") for _ in range(3)])
+    img = img.convert(mode)
+    if "A" in mode:
+        img.putalpha(Image.linear_gradient("L").resize(img.size))
+    return img
+
+
+# the lookup tables of enhance_color have to give the same results as the ImageEnhance chain
+@pytest.mark.parametrize("mode", ["L", "LA", "RGB", "RGBA"])
+def test_enhance_color_matches_image_enhance(mode):
+    img = get_img(mode)
+    for contrast, saturation, brightness in itertools.product(factors, [1.0, 0.6], factors):
+        params = process.Params(contrast=contrast, saturation=saturation, brightness=brightness, sharpness=1.0)
+        expected = img
+        if contrast != 1.0:
+            expected = ImageEnhance.Contrast(expected).enhance(contrast)
+        if saturation != 1.0:
+            expected = ImageEnhance.Color(expected).enhance(saturation)
+        if brightness != 1.0:
+            expected = ImageEnhance.Brightness(expected).enhance(brightness)
+
+        assert process.enhance_img(img, params).tobytes() == expected.tobytes(), (contrast, saturation, brightness)
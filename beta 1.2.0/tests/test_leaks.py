@@ -0,0 +1,80 @@
+import gc
+import io
+import os
+
+import pytest
+from PIL import Image
+
+import src.process_imgs as process
+from src.values import *
+
+runs = 5
+max_rss_growth = 32 * 1024 * 1024
+
+pytestmark = pytest.mark.skipif(not os.path.isdir("/proc/self/fd"), reason="needs /proc")
+
+
+def count_fds():
+    return len(os.listdir("/proc/self/fd"))
+
+
+def get_rss():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def encode(img, format):
+    output = io.BytesIO()
+    img.save(output, format)
+    return output.getvalue()
+
+
+# a folder of corrupt, truncated and unsupported files between a few readable images, the truncated images have valid
+# headers, so they are only found to be broken while they are decoded
+@pytest.fixture
+def batch(tmp_path):
+    in_dir = tmp_path / "in"
+    in_dir.mkdir()
+    img = Image.effect_noise((1000, 1000), 40).convert("RGB")
+    jpeg, png = encode(img, "JPEG"), encode(img, "PNG")
+    for i in range(4):
+        (in_dir / "good{}.jpg".format(i)).write_bytes(jpeg)
+        (in_dir / "truncated{}.jpg".format(i)).write_bytes(jpeg[:len(jpeg) // 3])
+        (in_dir / "truncated{}.png".format(i)).write_bytes(png[:len(png) // 3])
+        (in_dir / "corrupt{}.jpg".format(i)).write_bytes(os.urandom(50000))
+        (in_dir / "corrupt{}.png".format(i)).write_bytes(b"\x89PNG\r\n\x1a\n" + os.urandom(50000))
+        (in_dir / "empty{}.tif".format(i)).write_bytes(b"")
+        (in_dir / "notes{}.txt".format(i)).write_text("no image")
+        (in_dir / "anim{}.gif".format(i)).write_bytes(encode(img, "GIF"))
+    Image.new("RGBA", (200, 100), (255, 0, 0, 128)).save(tmp_path / "watermark.png")
+    return in_dir, tmp_path / "out", tmp_path / "watermark.png"
+
+
+@pytest.mark.parametrize("tool_index, values", [
+    (1, dict(perc=50)),
+    (4, dict()),
+    (7, dict(img_path=None, pos=4)),  # the watermark image of the batch
+    (7, dict(text="leak test", pos=4)),
+])
+def test_batch_releases_files_and_memory(batch, tool_index, values):
+    in_dir, out_dir, watermark_path = batch
+    if "img_path" in values:
+        values = dict(values, img_path=str(watermark_path))
+    params = process.Params(**values)
+    tool = get_ui_text("tool_options", "EN")[tool_index]
+
+    # the first run loads the modules, codecs and caches that are kept on purpose
+    assert process.process_imgs(str(in_dir), params, tool, str(out_dir), "EN", "_p") == 4
+    gc.collect()
+    fds, rss = count_fds(), get_rss()
+
+    # without the garbage collector, files and images kept alive by reference cycles (e.g. through the tracebacks of
+    # the failed images) stay open, so only releasing them explicitly passes
+    gc.disable()
+    try:
+        for _ in range(runs):
+            assert process.process_imgs(str(in_dir), params, tool, str(out_dir), "EN", "_p") == 4
+        assert count_fds() == fds
+        assert get_rss() - rss < max_rss_growth
+    finally:
+        gc.enable()
@@ -0,0 +1,56 @@
+import pytest
+from PIL import Image
+
+import src.process_imgs as process
+from src.values import *
+
+
+# returns the probe of a small image, which pretends to be larger than tiled_threshold
+def get_large_probe(tmp_path, name, mode="RGB"):
+    Image.effect_noise((400, 300), 40).convert(mode).save(tmp_path / name)
+    probe = process.probe_img(str(tmp_path), name)
+    probe.memory = tiled_threshold + 1
+    return probe
+
+
+# the greyscale tool decodes jpegs to greyscale directly, which needs less memory than processing them in strips
+def test_large_jpeg_greyscale_is_not_tiled(tmp_path):
+    probe = get_large_probe(tmp_path, "a.jpg")
+    assert process.get_route(probe, process.greyscale_img, process.Params(), None) == "full"
+
+
+@pytest.mark.parametrize("name", ["a.png", "a.bmp"])
+def test_large_greyscale_is_tiled(tmp_path, name):
+    probe = get_large_probe(tmp_path, name)
+    assert process.get_route(probe, process.greyscale_img, process.Params(), None) == "tiled"
+
+
+# pngs that the strip writer can't store are assembled as a whole from a source that is decoded as a whole as well
+@pytest.mark.parametrize("mode", ["I;16", "1"])
+def test_large_unstreamed_png_is_not_tiled(tmp_path, mode):
+    probe = get_large_probe(tmp_path, "a.png", mode)
+    assert process.get_route(probe, process.crop_img, process.Params(left=0, top=0, width=10, height=10), None) == \
+        "full"
+
+
+# the tiled estimate counts what is held as a whole: the decoded png source, but not the streamed greyscale result,
+# and the strips of the tiff source, but the assembled tiff result
+def test_tiled_memory_estimate(tmp_path):
+    probe = get_large_probe(tmp_path, "a.png")
+    assert process.get_memory_estimate(probe, process.greyscale_img, process.Params(), "tiled") == probe.memory
+
+    Image.effect_noise((400, 300), 40).convert("RGB").save(tmp_path / "a.tif")
+    probe = process.probe_img(str(tmp_path), "a.tif")
+    assert probe.striped
+    params = process.Params(left=0, top=0, width=100, height=50)
+    assert process.get_memory_estimate(probe, process.crop_img, params, "tiled") == \
+        2 * tiled_strip_bytes + 100 * 50 * 4
+
+
+# the watermark pattern covers the whole image on the full route, but is composited strip by strip on the tiled one
+def test_pattern_memory_estimate(tmp_path):
+    probe = get_large_probe(tmp_path, "a.png")
+    params = process.Params(text="a", pattern=True)
+    assert process.get_memory_estimate(probe, process.create_watermark, params, "full") == \
+        2 * probe.memory + 400 * 300 * 4
+    assert process.get_memory_estimate(probe, process.create_watermark, params, "tiled") == probe.memory
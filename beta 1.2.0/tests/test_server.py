@@ -0,0 +1,108 @@
+import concurrent.futures
+import http.client
+import io
+import threading
+
+import pytest
+from PIL import Image
+
+import src.server as server
+
+
+# starts a server on an unused port of localhost, returns the server and its address
+def start_server(**kwargs):
+    image_server = server.ImageServer(("127.0.0.1", 0), **kwargs)
+    threading.Thread(target=image_server.serve_forever, daemon=True).start()
+    return image_server, image_server.server_address[:2]
+
+
+def stop_server(image_server):
+    image_server.shutdown()
+    image_server.server_close()
+
+
+@pytest.fixture(scope="module")
+def address():
+    image_server, address = start_server(workers=2)
+    yield address
+    stop_server(image_server)
+
+
+@pytest.fixture(scope="module")
+def jpeg():
+    output = io.BytesIO()
+    Image.effect_noise((400, 300), 40).convert("RGB").save(output, "JPEG")
+    return output.getvalue()
+
+
+# posts data to path on the server, returns the status, the content type and the body of the response
+def post(address, path, data):
+    connection = http.client.HTTPConnection(*address, timeout=30)
+    try:
+        connection.request("POST", path, body=data)
+        response = connection.getresponse()
+        return response.status, response.getheader("Content-Type"), response.read()
+    finally:
+        connection.close()
+
+
+def test_crop(address, jpeg):
+    status, content_type, body = post(address, "/crop?width=100&height=50&pos=4", jpeg)
+    assert status == 200
+    assert content_type == "image/jpeg"
+    assert Image.open(io.BytesIO(body)).size == (100, 50)
+
+
+def test_output_format(address, jpeg):
+    status, content_type, body = post(address, "/resize_percentage?perc=50&format=png", jpeg)
+    assert status == 200
+    assert content_type == "image/png"
+    assert Image.open(io.BytesIO(body)).format == "PNG"
+
+
+def test_cached_response(address, jpeg):
+    first = post(address, "/flip?flip_mode=1", jpeg)
+    assert first[0] == 200
+    assert post(address, "/flip?flip_mode=1", jpeg) == first
+
+
+def test_keep_alive(address, jpeg):
+    connection = http.client.HTTPConnection(*address, timeout=30)
+    try:
+        for angle in (90, 180):
+            connection.request("POST", "/rotate?angle={}".format(angle), body=jpeg)
+            response = connection.getresponse()
+            assert response.status == 200
+            response.read()
+    finally:
+        connection.close()
+
+
+@pytest.mark.parametrize("path, status", [
+    ("/unknown", 404),
+    ("/crop?width=100", 400),  # height and position missing
+    ("/crop?boxes=0,0,10,10", 400),  # the multi region crop isn't served
+    ("/rotate?angle=10&resample=7", 400),  # no such resampling filter
+    ("/resize_percentage?perc=abc", 400),
+    ("/crop?width=10&height=10&pos=4&format=gif", 400),
+])
+def test_errors(address, jpeg, path, status):
+    assert post(address, path, jpeg)[0] == status
+
+
+def test_invalid_image(address):
+    assert post(address, "/greyscale", b"no image")[0] == 400
+
+
+# requests beyond the workers and the queue are rejected instead of waiting
+def test_overload():
+    output = io.BytesIO()
+    Image.effect_noise((3000, 2000), 40).convert("RGB").save(output, "JPEG")
+    image_server, address = start_server(workers=1, queue_size=0)
+    try:
+        with concurrent.futures.ThreadPoolExecutor(4) as pool:
+            paths = ["/rotate?angle={}&resample=2".format(angle) for angle in (10, 20, 30, 40)]
+            statuses = list(pool.map(lambda path: post(address, path, output.getvalue())[0], paths))
+    finally:
+        stop_server(image_server)
+    assert sorted(statuses) == [200, 503, 503, 503]
@@ -0,0 +1,37 @@
+import pytest
+from PIL import Image
+
+import src.process_imgs as process
+from src.values import *
+
+
+# pngs in modes the strip writer can't store directly
+@pytest.fixture
+def in_dir(tmp_path):
+    in_dir = tmp_path / "in"
+    in_dir.mkdir()
+    noise = Image.effect_noise((300, 200), 60)
+    Image.linear_gradient("L").resize((300, 200)).convert("I;16").save(in_dir / "i16.png")
+    noise.convert("1").save(in_dir / "bw.png")
+    noise.convert("RGB").quantize(16).save(in_dir / "palette.png", transparency=3)
+    noise.convert("RGB").save(in_dir / "rgb.png", transparency=(128, 128, 128))
+    return in_dir
+
+
+# the tiled route has to write the same images as the full route
+@pytest.mark.parametrize("tool_index, params", [
+    (0, process.Params(width=100, height=80, pos=4)),
+    (4, process.Params()),
+    (7, process.Params(text="tiled", pos=4)),
+])
+def test_tiled_matches_full(in_dir, tmp_path, tool_index, params):
+    tool = get_ui_text("tool_options", "EN")[tool_index]
+    for tiled in (False, True):
+        assert process.process_imgs(str(in_dir), params, tool, str(tmp_path / str(tiled)), "EN", "", tiled=tiled) == 4
+
+    for path in in_dir.iterdir():
+        with Image.open(tmp_path / "False" / path.name) as full, Image.open(tmp_path / "True" / path.name) as tiled:
+            assert tiled.mode == full.mode, path.name
+            assert tiled.tobytes() == full.tobytes(), path.name
+            assert tiled.info.get("transparency") == full.info.get("transparency"), path.name
+            assert tiled.getpalette() == full.getpalette(), path.name
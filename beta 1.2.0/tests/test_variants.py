@@ -0,0 +1,40 @@
+import io
+
+import pytest
+from PIL import Image
+
+import src.process_imgs as process
+
+
+@pytest.fixture
+def jpeg():
+    output = io.BytesIO()
+    Image.effect_noise((2000, 1600), 40).convert("RGB").save(output, "JPEG")
+    return output.getvalue()
+
+
+# greyscale variants are decoded in greyscale and already scaled down by the decoder
+@pytest.mark.parametrize("tool, mode", [(process.greyscale_img, "L"), (process.flip_img, "RGB")])
+def test_draft_scales_down(jpeg, tool, mode):
+    with Image.open(io.BytesIO(jpeg)) as img:
+        process.draft_variants(img, tool, 200)
+        assert img.mode == mode
+        assert img.size == (500, 400)  # scaled by 1/4, the largest scale that keeps twice the width
+
+
+def test_draft_without_width(jpeg):
+    with Image.open(io.BytesIO(jpeg)) as img:
+        process.draft_variants(img, process.greyscale_img, None)
+        assert img.mode == "L"
+        assert img.size == (2000, 1600)
+
+
+def test_variants_from_command_line(jpeg, tmp_path):
+    (tmp_path / "in").mkdir()
+    (tmp_path / "in" / "a.jpg").write_bytes(jpeg)
+    process.main([str(tmp_path / "in"), str(tmp_path / "out"), "Convert to greyscale", "--suffix", "",
+                  "--variant", "_l", "--variant", "_s,200,png"])
+
+    with Image.open(tmp_path / "out" / "a_l.jpg") as large, Image.open(tmp_path / "out" / "a_s.png") as small:
+        assert (large.size, large.mode) == ((2000, 1600), "L")
+        assert (small.size, small.mode) == ((200, 160), "L")
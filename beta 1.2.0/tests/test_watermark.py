@@ -0,0 +1,15 @@
+from PIL import Image
+
+import src.watermark as watermark
+
+
+# layers larger than the whole cache are returned without being cached, the others are evicted down to the limit
+def test_layer_cache_limit():
+    cache = watermark.LayerCache(max_bytes=100 * 100 * 4)
+    assert cache.get("large", lambda: Image.new("RGBA", (200, 100))).size == (200, 100)
+    assert cache.size == 0 and not cache.entries
+
+    cache.get("a", lambda: Image.new("RGBA", (100, 60)))
+    cache.get("b", lambda: Image.new("RGBA", (100, 60)))
+    assert list(cache.entries) == ["b"]
+    assert cache.size == 100 * 60 * 4